@@ -1,38 +1,149 @@
-from flask import Flask, Response, jsonify, render_template
+from flask import Flask, Response, jsonify, render_template, request, make_response, send_file, abort
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import io
 import time
 import threading
 import random
-import base64
-import json
+import uuid
+import orjson
 import cv2
 import requests
-from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 from dotenv import load_dotenv
 import os
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, joinedload, selectinload
+from functools import wraps, lru_cache
+from datetime import datetime
 import queue
 import multiprocessing as mp
 from concurrent.futures import ThreadPoolExecutor
 
+# PyTurboJPEG (optional) encodes stream frames with libjpeg-turbo's SIMD paths
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError):
+    turbo_jpeg = None
+
 # Import our real AI components
 from hand_detector import HandDetector
 from gemini_analyzer import GeminiAnalyzer
-from audio_notifier import AudioNotifier
+from audio_notifier import AudioNotifier, create_http_session
 
 # Import new database models and managers
-from models import db, Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert
+from models import db, Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert, upgrade_schema
 from session_manager import SessionManager, IncidentManager, GeminiAnalysisManager, AlertManager
+from fast_serialize import sessions_json, incidents_json
+from frame_store import FRAME_KEY_PATTERN, frame_path, frame_url, load_frame
 
 # Load environment variables
 load_dotenv()
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Serve jsonify() responses through orjson's C serializer (honouring Flask's sort_keys/compact settings)"""
+    
+    # Detection results can carry NumPy scalars straight from OpenCV/MediaPipe
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    
+    def _orjson_option(self, sort_keys, indent):
+        """orjson flags for the json.dumps-style sort_keys/indent arguments"""
+        option = self.options
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+    
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        indent = kwargs.pop('indent', None)
+        # orjson only indents by 2 and has no other json.dumps options; let the stdlib handle those
+        if kwargs or indent not in (None, 0, 2):
+            return super().dumps(obj, sort_keys=sort_keys, indent=indent, **kwargs)
+        return orjson.dumps(obj, option=self._orjson_option(sort_keys, indent)).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(
+            orjson.dumps(obj, option=self._orjson_option(self.sort_keys, indent)),
+            mimetype=self.mimetype
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 app.config['SECRET_KEY'] = 'dev-secret-key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///security_monitor.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Keep a small pool of long-lived connections so SQLite's page cache survives between requests
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 5,
+    'pool_pre_ping': True,
+    'connect_args': {'check_same_thread': False}
+}
+
+
+# Bumped on every commit that wrote rows; list endpoints use it as their ETag
+data_version = 0
+# Distinguishes this process's ETags from a previous run's (the counter restarts at 0)
+BOOT_ID = uuid.uuid4().hex[:12]
+
+
+@event.listens_for(OrmSession, "after_flush")
+def mark_flush_dirty(session, flush_context):
+    """Note that this transaction wrote rows (the version only changes once it commits)"""
+    session.info['dirty'] = True
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def mark_statement_dirty(orm_execute_state):
+    """Core UPDATE/INSERT/DELETE statements run through the session write rows without a flush"""
+    if orm_execute_state.is_update or orm_execute_state.is_insert or orm_execute_state.is_delete:
+        orm_execute_state.session.info['dirty'] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def bump_data_version(session):
+    """Invalidate cached list responses once written rows are committed"""
+    global data_version
+    if session.info.pop('dirty', False):
+        data_version += 1
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def clear_dirty(session):
+    """Rolled-back writes never became visible, so they don't change the version"""
+    session.info.pop('dirty', None)
+
+
+def etag_cached(view):
+    """Answer dashboard polls with 304 Not Modified while nothing has been written"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # While monitoring, live durations and counters change without a flush
+        if is_monitoring:
+            return view(*args, **kwargs)
+        
+        etag = f"{BOOT_ID}-v{data_version}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
 
 # Initialize database with app
 db.init_app(app)
@@ -41,15 +152,18 @@ db.init_app(app)
 with app.app_context():
     try:
         db.create_all()
+        upgrade_schema()
         print("✅ Database tables initialized")
     except Exception as e:
         print(f"⚠️  Database initialization: {e}")
 
 # Initialize AI components
 print("🤖 Initializing AI components...")
-hand_detector = HandDetector()
+http_session = create_http_session()  # One connection pool for camera snapshots and ElevenLabs
+hand_detector = HandDetector(session=http_session)
+hand_detector.warmup()
 gemini_analyzer = GeminiAnalyzer()
-audio_notifier = AudioNotifier()
+audio_notifier = AudioNotifier(session=http_session)
 
 # Session and monitoring state
 is_monitoring = False
@@ -60,6 +174,9 @@ global_frame_count = 0
 # Pi camera URL
 PI_CAMERA_URL = "http://100.101.51.31:5000/video_feed"
 
+# Low-latency FFmpeg demuxer flags for the MJPEG stream (read when the capture opens)
+os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', 'fflags;nobuffer|flags;low_delay')
+
 # Real-time results storage
 latest_results = {
     'photo_count': 0,
@@ -76,22 +193,77 @@ latest_results = {
 
 # PROPER VIDEO PROCESSING ARCHITECTURE
 # Separate threads for video capture and MediaPipe hand detection processing
-frame_queue = queue.Queue(maxsize=10)  # Buffer for raw frames
-processed_frame_queue = queue.Queue(maxsize=10)  # Buffer for processed frames with hand detections
+# Both queues carry (frame_id, slot) pairs indexing into frame_slots; a slot goes back
+# to free_slots once its frame is encoded for the stream or dropped, so capture never allocates
+# The queues stay shallow so the stream shows the newest frame: when one is full the oldest
+# frame is dropped, so at most FRAME_QUEUE_DEPTH frame intervals of lag build up per stage
+FRAME_QUEUE_DEPTH = 2
+frame_queue = queue.Queue(maxsize=FRAME_QUEUE_DEPTH)  # Buffer for raw frames
+processed_frame_queue = queue.Queue(maxsize=FRAME_QUEUE_DEPTH)  # Buffer for processed frames with hand detections
+
+# Preallocated BGR frame buffers (sized from the first captured frame); enough for both
+# full queues plus the frames being captured, detected and encoded (with room to spare)
+FRAME_RING_SIZE = 2 * FRAME_QUEUE_DEPTH + 4
+frame_slots = []
+free_slots = queue.Queue()
 video_capture_thread = None
 detection_processing_thread = None
+mjpeg_encoder_thread = None
+stream_start_lock = threading.Lock()  # Also guards stream_viewers
+stream_viewers = 0  # Connected /detection_stream clients
+
+# Latest processed frame as an MJPEG part, encoded once and shared by every stream client
+# ('seq' counts published frames so each client sends every frame at most once)
+latest_stream_part = {'bytes': b'', 'frame_id': None, 'seq': 0, 'cv': threading.Condition()}
 detection_stream_active = False
 
 # Store latest visualized image
 latest_visualized_image = None
 
+# MJPEG multipart framing, built once instead of per yielded frame
+FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+FRAME_TRAILER = b'\r\n'
+
+# JPEG quality for the detection stream; it's a live preview, so trade detail for encode time
+# and bandwidth (stored incident frames keep their own quality)
+STREAM_JPEG_QUALITY = 70
+
+def mjpeg_part(image):
+    """JPEG-encode a frame and wrap it in MJPEG framing with a single copy"""
+    if turbo_jpeg is not None:
+        buffer = turbo_jpeg.encode(image, quality=STREAM_JPEG_QUALITY, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    else:
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, STREAM_JPEG_QUALITY])
+    # bytes.join reads the encoder's array directly, so the JPEG isn't copied to bytes first
+    return b''.join((FRAME_HEADER, buffer, FRAME_TRAILER))
+
+# Status frames only depend on their text, so each variant is rendered and encoded once
+@lru_cache(maxsize=16)
+def placeholder_part(queue_size):
+    """MJPEG part for the 'waiting for frames' placeholder"""
+    placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(placeholder, "Waiting for frames...", (150, 200), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+    cv2.putText(placeholder, f"Queue size: {queue_size}", (150, 250), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+    return mjpeg_part(placeholder)
+
+@lru_cache(maxsize=32)
+def error_part(message):
+    """MJPEG part for a stream error frame"""
+    error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(error_frame, f"Stream Error: {message}", (50, 200), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    return mjpeg_part(error_frame)
+
 # PROPER VIDEO PROCESSING FUNCTIONS
 def video_capture_worker():
     """Separate thread for continuous video capture from MJPEG stream"""
     global detection_stream_active, frame_queue
     
     print("🎥 Starting video capture worker...")
-    cap = cv2.VideoCapture(PI_CAMERA_URL)
+    cap = cv2.VideoCapture(PI_CAMERA_URL, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
     
     if not cap.isOpened():
         print(f"❌ Failed to open video stream: {PI_CAMERA_URL}")
@@ -99,39 +271,141 @@ def video_capture_worker():
     
     frame_count = 0
     while detection_stream_active and cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            print("❌ Failed to read frame from video stream")
-            break
+        if not frame_slots:
+            # First frame decides the buffer size; allocate the whole ring up front
+            ret, frame = cap.read()
+            if not ret:
+                print("❌ Failed to read frame from video stream")
+                break
+            frame_slots.extend(np.empty_like(frame) for _ in range(FRAME_RING_SIZE))
+            for slot in range(FRAME_RING_SIZE):
+                free_slots.put(slot)
+            slot = free_slots.get()
+            np.copyto(frame_slots[slot], frame)
+        else:
+            try:
+                slot = free_slots.get_nowait()
+            except queue.Empty:
+                # Every buffer is busy: pull the frame off the stream without decoding it,
+                # so the next decoded frame is the newest rather than a stale backlog
+                if not cap.grab():
+                    print("❌ Failed to read frame from video stream")
+                    break
+                continue
+            
+            # Decode straight into the slot's buffer
+            ret = cap.grab()
+            if ret:
+                ret, frame = cap.retrieve(frame_slots[slot])
+            if not ret:
+                free_slots.put(slot)
+                print("❌ Failed to read frame from video stream")
+                break
+            if frame is not frame_slots[slot]:
+                # Stream resolution changed; OpenCV allocated a new buffer, adopt it
+                frame_slots[slot] = frame
         
         frame_count += 1
         
         # Add frame to queue (non-blocking)
         try:
-            frame_queue.put_nowait((frame_count, frame.copy()))
+            frame_queue.put_nowait((frame_count, slot))
             if frame_count % 30 == 0:  # Log every 30 frames
                 print(f"🎥 Captured frame #{frame_count}")
         except queue.Full:
-            # Remove oldest frame if queue is full
+            # Drop the oldest frame (recycling its slot) if queue is full
             try:
-                frame_queue.get_nowait()
-                frame_queue.put_nowait((frame_count, frame.copy()))
-            except queue.Empty:
-                pass
-        
-        # Small delay to prevent overwhelming
-        time.sleep(0.033)  # ~30 FPS capture
+                _, dropped_slot = frame_queue.get_nowait()
+                free_slots.put(dropped_slot)
+                frame_queue.put_nowait((frame_count, slot))
+            except (queue.Empty, queue.Full):
+                free_slots.put(slot)
+        # No sleep: grab() blocks until the camera delivers the next frame
     
     cap.release()
     print("🎥 Video capture worker stopped")
 
+# Motion gate: while no hands are tracked, a sampled frame whose 80x60 grayscale thumbnail
+# differs from the last detected frame's by less than this mean absolute difference skips
+# MediaPipe, up to DETECTION_MAX_SKIP_FRAMES frames in a row
+MOTION_GATE_THRESHOLD = 2.0
+DETECTION_MAX_SKIP_FRAMES = 30
+
+def motion_thumbnail(frame):
+    """80x60 grayscale thumbnail of a BGR frame for the motion gate"""
+    small = cv2.resize(frame, (80, 60), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+# Session frame counts are written every SESSION_FLUSH_FRAMES detection frames or
+# SESSION_FLUSH_SECONDS, whichever comes first (and once more when the session ends)
+SESSION_FLUSH_FRAMES = 30
+SESSION_FLUSH_SECONDS = 5.0
+
+# Gemini batch analysis runs off the detection thread; only one analysis is in flight
+# at a time and batches that come due meanwhile are skipped (its result covers them)
+gemini_executor = ThreadPoolExecutor(max_workers=1)
+gemini_future = None
+
+def analyze_batch_in_background(inc_id, imgs, batch, frame_start, frame_end):
+    """Gemini analysis of one batch of incident frames, run on gemini_executor"""
+    try:
+        print(f"🤖 [BG] Analyzing {len(imgs)} frames (batch #{batch})...")
+        start_time = time.time()
+        
+        # Call Gemini API
+        is_theft, threat_confidence, explanation = gemini_analyzer.analyze_theft_attempt(imgs, incident_id=inc_id)
+        
+        latency_ms = int((time.time() - start_time) * 1000)
+        print(f"🤖 [BG] Gemini response: Threat={is_theft}, Confidence={threat_confidence}%, Latency={latency_ms}ms")
+        
+        # Record analysis in database
+        with app.app_context():
+            GeminiAnalysisManager.record_analysis(
+                incident_id=inc_id,
+                frame_start=frame_start,
+                frame_end=frame_end,
+                threat_detected=is_theft,
+                confidence=threat_confidence,
+                explanation=explanation,
+                latency_ms=latency_ms
+            )
+            
+            # If real threat detected, END THE INCIDENT
+            if is_theft and threat_confidence > 60:
+                print(f"🚨 [BG] THREAT CONFIRMED! Ending incident and sending alert...")
+                # record_analysis has already marked the incident and its session as a threat
+                
+                # Send alert
+                AlertManager.send_alert(
+                    incident_id=inc_id,
+                    alert_type='theft_confirmed',
+                    message=f"Potential theft detected: {explanation}",
+                    audio_played=False,
+                    notification_sent=True
+                )
+                
+                # Trigger audio alert
+                try:
+                    audio_notifier.send_alert(threat_confidence, explanation)
+                    print(f"🔊 [BG] Audio alert sent")
+                except Exception as e:
+                    print(f"❌ [BG] Audio alert failed: {e}")
+                
+                # END THE INCIDENT (threat detected by Gemini)
+                IncidentManager.end_incident(inc_id)
+                print(f"🛑 [BG] INCIDENT #{inc_id} ENDED - Threat confirmed by Gemini")
+            else:
+                print(f"✅ [BG] No threat in batch #{batch} (Confidence: {threat_confidence}%)")
+    except Exception as e:
+        print(f"❌ [BG] Gemini analysis error: {e}")
+
 def detection_processing_worker():
     """
     Separate thread for MediaPipe hand detection processing of captured frames
     Also handles incident tracking and escalation logic
     """
     global detection_stream_active, processed_frame_queue, is_monitoring
-    global current_session_id, current_incident_id, global_frame_count
+    global current_session_id, current_incident_id, global_frame_count, gemini_future
     
     print("🤖 Starting MediaPipe hand detection processing worker...")
     frame_count = 0
@@ -139,19 +413,39 @@ def detection_processing_worker():
     last_detections = []
     detection_cooldown = 0
     DETECTION_SAMPLE_RATE = 5  # Process every 5th frame
+    PREVIEW_SAMPLE_RATE = 30  # Every 30th frame (~1/s) while the stream is only a preview (not monitoring)
+    last_detection_thumb = None  # Motion thumbnail of the last frame MediaPipe ran on
+    last_detection_frame = 0
+    last_count_flush = time.monotonic()  # When the session frame count was last written
+    slot = None  # Ring slot currently held by this worker
     
     while detection_stream_active:
         try:
             # Get frame from queue (with timeout)
-            frame_id, frame = frame_queue.get(timeout=1.0)
+            frame_id, slot = frame_queue.get(timeout=1.0)
+            frame = frame_slots[slot]
             frame_count += 1
             
             # Only run MediaPipe detection every Nth frame OR when detection cooldown is active
-            should_run_detection = (frame_count % DETECTION_SAMPLE_RATE == 0) or (detection_cooldown > 0)
+            sample_rate = DETECTION_SAMPLE_RATE if is_monitoring else PREVIEW_SAMPLE_RATE
+            should_run_detection = (frame_count % sample_rate == 0) or (detection_cooldown > 0)
+            
+            # With no hands being tracked, skip sampled frames where nothing has moved since
+            # the last detection (still re-checking at least every DETECTION_MAX_SKIP_FRAMES)
+            if should_run_detection:
+                thumb = motion_thumbnail(frame)
+                if (detection_cooldown == 0 and last_detection_thumb is not None
+                        and frame_count - last_detection_frame < DETECTION_MAX_SKIP_FRAMES
+                        and cv2.norm(thumb, last_detection_thumb, cv2.NORM_L1) / thumb.size < MOTION_GATE_THRESHOLD):
+                    should_run_detection = False
+                else:
+                    last_detection_thumb = thumb
+                    last_detection_frame = frame_count
             
             if should_run_detection:
                 detection_frame_count += 1
-                print(f"🤖 Processing MediaPipe frame #{detection_frame_count} (total #{frame_count})")
+                if detection_frame_count % 30 == 0:  # Log every 30 detections
+                    print(f"🤖 Processing MediaPipe frame #{detection_frame_count} (total #{frame_count})")
                 
                 # Run MediaPipe hand detection
                 has_hand, confidence, detections = hand_detector.detect_hands(frame)
@@ -161,14 +455,12 @@ def detection_processing_worker():
                     # Increment frame count (no DB operation needed here)
                     global_frame_count += 1
                     
-                    # Only do DB operations every 4th frame to reduce lag
-                    if global_frame_count % 4 == 0:
+                    # Write the session frame count in batches rather than committing every few frames
+                    if (global_frame_count % SESSION_FLUSH_FRAMES == 0
+                            or time.monotonic() - last_count_flush >= SESSION_FLUSH_SECONDS):
                         with app.app_context():
-                            # Batch update session frame count every 4 frames
-                            session = Session.query.get(current_session_id)
-                            if session:
-                                session.total_frames = global_frame_count
-                                db.session.commit()
+                            SessionManager.set_frame_count(current_session_id, global_frame_count)
+                        last_count_flush = time.monotonic()
                     
                     if has_hand and detections:
                         with app.app_context():
@@ -181,7 +473,7 @@ def detection_processing_worker():
                             
                             # Add frame to incident (save every 4th frame to reduce lag)
                             should_save_frame = (global_frame_count % 4 == 0)
-                            incident_frame, should_escalate = IncidentManager.add_frame_to_incident(
+                            frame_number, should_escalate = IncidentManager.add_frame_to_incident(
                                 incident_id=current_incident_id,
                                 global_frame_num=global_frame_count,
                                 hand_count=len(detections),
@@ -191,96 +483,33 @@ def detection_processing_worker():
                             )
                             
                             # Check if we should send batch to Gemini (every 10 frames: 10, 20, 30...)
-                            incident = Incident.query.get(current_incident_id)
-                            
-                            if should_escalate or (incident and incident.total_frames % 10 == 0 and incident.total_frames > 0):
-                                batch_num = incident.total_frames // 10
-                                print(f"⚠️  BATCH ANALYSIS #{batch_num} - Incident #{current_incident_id} at {incident.total_frames} frames")
-                                
-                                # Get last 10 frames for Gemini analysis
-                                frames_for_analysis = IncidentManager.get_incident_frames_for_analysis(
-                                    current_incident_id, last_n_frames=10
-                                )
-                                
-                                # Convert frames to PIL Images for Gemini
-                                images_for_gemini = []
-                                for inc_frame in frames_for_analysis:
-                                    if inc_frame.image_data:
-                                        # Decode base64 image
-                                        img_bytes = base64.b64decode(inc_frame.image_data)
-                                        img = Image.open(io.BytesIO(img_bytes))
-                                        images_for_gemini.append(img)
+                            if should_escalate or frame_number % 10 == 0:
+                                batch_num = frame_number // 10
+                                print(f"⚠️  BATCH ANALYSIS #{batch_num} - Incident #{current_incident_id} at {frame_number} frames")
                                 
-                                if images_for_gemini:
-                                    # Skip Gemini for now if there's already a pending analysis (avoid queueing)
-                                    print(f"⚡ Queueing Gemini analysis for batch #{batch_num} (non-blocking)...")
+                                if gemini_future is not None and not gemini_future.done():
+                                    # One analysis in flight at a time; its result covers this batch too
+                                    print(f"⏭️ Gemini still analyzing, skipping batch #{batch_num}")
+                                else:
+                                    # Get last 10 frames for Gemini analysis
+                                    frames_for_analysis = IncidentManager.get_incident_frames_for_analysis(
+                                        current_incident_id, last_n_frames=10
+                                    )
                                     
-                                    # Run Gemini analysis in background thread to avoid blocking
-                                    def analyze_in_background(inc_id, imgs, batch, frames_list):
-                                        try:
-                                            print(f"🤖 [BG] Analyzing {len(imgs)} frames (batch #{batch})...")
-                                            start_time = time.time()
-                                            
-                                            # Call Gemini API
-                                            is_theft, threat_confidence, explanation = gemini_analyzer.analyze_theft_attempt(imgs)
-                                            
-                                            latency_ms = int((time.time() - start_time) * 1000)
-                                            print(f"🤖 [BG] Gemini response: Threat={is_theft}, Confidence={threat_confidence}%, Latency={latency_ms}ms")
-                                            
-                                            # Record analysis in database
-                                            with app.app_context():
-                                                GeminiAnalysisManager.record_analysis(
-                                                    incident_id=inc_id,
-                                                    frame_start=frames_list[0].frame_number,
-                                                    frame_end=frames_list[-1].frame_number,
-                                                    threat_detected=is_theft,
-                                                    confidence=threat_confidence,
-                                                    explanation=explanation,
-                                                    latency_ms=latency_ms
-                                                )
-                                                
-                                                # If real threat detected, END THE INCIDENT
-                                                if is_theft and threat_confidence > 60:
-                                                    print(f"🚨 [BG] THREAT CONFIRMED! Ending incident and sending alert...")
-                                                    
-                                                    # Mark entire incident as high threat
-                                                    incident_obj = Incident.query.get(inc_id)
-                                                    if incident_obj:
-                                                        incident_obj.threat_detected = True
-                                                        incident_obj.threat_confidence = threat_confidence
-                                                        incident_obj.threat_explanation = explanation
-                                                        db.session.commit()
-                                                    
-                                                    # Send alert
-                                                    AlertManager.send_alert(
-                                                        incident_id=inc_id,
-                                                        alert_type='theft_confirmed',
-                                                        message=f"Potential theft detected: {explanation}",
-                                                        audio_played=False,
-                                                        notification_sent=True
-                                                    )
-                                                    
-                                                    # Trigger audio alert
-                                                    try:
-                                                        audio_notifier.send_alert(threat_confidence, explanation)
-                                                        print(f"🔊 [BG] Audio alert sent")
-                                                    except Exception as e:
-                                                        print(f"❌ [BG] Audio alert failed: {e}")
-                                                    
-                                                    # END THE INCIDENT (threat detected by Gemini)
-                                                    IncidentManager.end_incident(inc_id)
-                                                    print(f"🛑 [BG] INCIDENT #{inc_id} ENDED - Threat confirmed by Gemini")
-                                                else:
-                                                    print(f"✅ [BG] No threat in batch #{batch} (Confidence: {threat_confidence}%)")
-                                        except Exception as e:
-                                            print(f"❌ [BG] Gemini analysis error: {e}")
+                                    # Stored frames are already JPEGs; hand Gemini the raw bytes
+                                    images_for_gemini = []
+                                    for inc_frame in frames_for_analysis:
+                                        image = load_frame(inc_frame.image_sha256) if inc_frame.image_sha256 else None
+                                        if image:
+                                            images_for_gemini.append(image)
                                     
-                                    # Start analysis in background thread (non-blocking)
-                                    threading.Thread(
-                                        target=analyze_in_background, 
-                                        args=(current_incident_id, images_for_gemini, batch_num, frames_for_analysis),
-                                        daemon=True
-                                    ).start()
+                                    if images_for_gemini:
+                                        # Run Gemini analysis on the executor to avoid blocking detection
+                                        print(f"⚡ Queueing Gemini analysis for batch #{batch_num} (non-blocking)...")
+                                        gemini_future = gemini_executor.submit(
+                                            analyze_batch_in_background, current_incident_id, images_for_gemini, batch_num,
+                                            frames_for_analysis[0].frame_number, frames_for_analysis[-1].frame_number
+                                        )
                     else:
                         # No hands detected
                         if current_incident_id:
@@ -292,12 +521,20 @@ def detection_processing_worker():
                 
                 # Update visualization
                 if has_hand and detections:
+                    if detection_cooldown == 0 or len(detections) != len(last_detections):
+                        # Log when hands appear or their count changes, not on every detection
+                        print(f"🖐️ Hands detected: {len(detections)} hands")
                     last_detections = detections
                     detection_cooldown = 15  # Keep drawing for 15 frames
-                    print(f"🖐️ Hands detected: {len(detections)} hands")
                 else:
                     detection_cooldown = max(0, detection_cooldown - 1)
             
+            if stream_viewers == 0:
+                # Nobody is watching: skip the overlays and encoding, the slot goes straight back
+                free_slots.put(slot)
+                slot = None
+                continue
+            
             # Always draw the last known detections (if any)
             if last_detections and detection_cooldown > 0:
                 frame = hand_detector.draw_detections(frame, last_detections)
@@ -311,26 +548,58 @@ def detection_processing_worker():
             cv2.putText(frame, efficiency_text, (10, 60), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
             
-            # Put processed frame in output queue
+            # Put processed frame in output queue (the slot now belongs to the stream)
             try:
-                processed_frame_queue.put_nowait((frame_id, frame))
+                processed_frame_queue.put_nowait((frame_id, slot))
             except queue.Full:
-                # Remove oldest processed frame if queue is full
+                # Drop the oldest processed frame (recycling its slot) if queue is full
                 try:
-                    processed_frame_queue.get_nowait()
-                    processed_frame_queue.put_nowait((frame_id, frame))
-                except queue.Empty:
-                    pass
+                    _, dropped_slot = processed_frame_queue.get_nowait()
+                    free_slots.put(dropped_slot)
+                    processed_frame_queue.put_nowait((frame_id, slot))
+                except (queue.Empty, queue.Full):
+                    free_slots.put(slot)
+            slot = None
             
         except queue.Empty:
             # No frames available, continue
             continue
         except Exception as e:
             print(f"❌ Error in MediaPipe hand detection processing: {e}")
+            if slot is not None:
+                free_slots.put(slot)
+                slot = None
             continue
     
     print("🤖 MediaPipe hand detection processing worker stopped")
 
+def mjpeg_encoder_worker():
+    """Separate thread that JPEG-encodes each processed frame once for all stream clients"""
+    print("📡 Starting MJPEG encoder worker...")
+    
+    while detection_stream_active:
+        try:
+            frame_id, slot = processed_frame_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        
+        # Encode frame as JPEG, then hand its slot back to the capture worker
+        try:
+            part = mjpeg_part(frame_slots[slot])
+        except Exception as e:
+            print(f"❌ Error encoding stream frame: {e}")
+            continue
+        finally:
+            free_slots.put(slot)
+        
+        with latest_stream_part['cv']:
+            latest_stream_part['bytes'] = part
+            latest_stream_part['frame_id'] = frame_id
+            latest_stream_part['seq'] += 1
+            latest_stream_part['cv'].notify_all()
+    
+    print("📡 MJPEG encoder worker stopped")
+
 # Detection stream processing
 detection_stream_active = False
 
@@ -350,43 +619,6 @@ def update_dashboard_results(photo_count, detection_data, theft_detected, theft_
         'timestamp': detection_data['timestamp']
     }
 
-def real_monitoring_loop():
-    """
-    Real AI monitoring loop with proper incident tracking
-    
-    Workflow:
-    1. Process each frame from video stream
-    2. Detect hands with MediaPipe
-    3. If hands detected:
-       - Create incident if none active
-       - Add frame to incident
-       - Check if 10 frames reached (escalation)
-       - If escalated: Send to Gemini for analysis
-       - If threat confirmed: Alert user
-    4. If no hands detected:
-       - End current incident if any
-    """
-    global is_monitoring, current_session_id, current_incident_id, global_frame_count
-    
-    print("🔍 Starting AI monitoring loop with incident tracking")
-    
-    # Use frame_queue from detection_processing_worker instead of creating new connection
-    # This monitoring loop just handles the database logic, not video processing
-    
-    while is_monitoring:
-        try:
-            # Check if we have detection results from the processing worker
-            # This is a lightweight loop that just manages incidents
-            time.sleep(0.1)  # Check 10 times per second
-            
-        except Exception as e:
-            print(f"❌ ERROR in monitoring loop: {e}")
-            import traceback
-            traceback.print_exc()
-            time.sleep(1)
-    
-    print("🔍 Monitoring loop ended")
-
 # API Routes
 @app.route('/api/start_monitoring', methods=['POST'])
 def start_monitoring():
@@ -435,7 +667,7 @@ def stop_monitoring():
         
         # End the session
         with app.app_context():
-            session = SessionManager.end_session(current_session_id)
+            session = SessionManager.end_session(current_session_id, total_frames=global_frame_count)
             print(f"⏹️ MONITORING STOPPED - Session #{current_session_id}")
             print(f"   Duration: {session.ended_at - session.started_at if session.ended_at else 'N/A'}")
             print(f"   Total frames: {session.total_frames}")
@@ -460,20 +692,24 @@ def stop_monitoring():
         })
 
 @app.route('/api/incidents')
+@etag_cached
 def get_incidents():
     """Get recent incidents from database"""
-    incidents = Incident.query.order_by(Incident.started_at.desc()).limit(20).all()
-    return jsonify({'incidents': [incident.to_dict() for incident in incidents]})
+    return Response(incidents_json(limit=20), mimetype='application/json')
 
 @app.route('/api/database_stats')
+@etag_cached
 def get_database_stats():
     """Debug endpoint to check database contents"""
     try:
-        total_sessions = Session.query.count()
-        total_incidents = Incident.query.count()
-        threats_count = Incident.query.filter_by(threat_detected=True).count()
-        escalated_count = Incident.query.filter_by(is_escalated=True).count()
-        analyzed_count = Incident.query.filter_by(gemini_analyzed=True).count()
+        # One aggregate pass over incidents instead of a COUNT(*) per statistic
+        total_sessions, total_incidents, threats_count, escalated_count, analyzed_count = db.session.query(
+            db.select(db.func.count(Session.id)).scalar_subquery(),
+            db.func.count(Incident.id),
+            db.func.coalesce(db.func.sum(db.case((Incident.threat_detected == True, 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((Incident.is_escalated == True, 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((Incident.gemini_analyzed == True, 1), else_=0)), 0)
+        ).one()
         
         # Get sample of incidents with their threat status
         sample_incidents = Incident.query.order_by(Incident.id.desc()).limit(5).all()
@@ -499,29 +735,45 @@ def get_database_stats():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/threats')
+@etag_cached
 def get_threats():
     """Get all incidents marked as threats by Gemini"""
     try:
         # Query for threats
-        threats = Incident.query.filter_by(threat_detected=True).order_by(Incident.started_at.desc()).all()
+        threats = Incident.query.options(selectinload(Incident.gemini_analyses)).filter_by(
+            threat_detected=True
+        ).order_by(Incident.started_at.desc()).all()
         
         print(f"🔍 Threats API called - Found {len(threats)} threats in database")
         
-        # Also check total incidents for debugging
-        all_incidents = Incident.query.count()
-        print(f"   Total incidents in database: {all_incidents}")
+        # Resolve one sample image per threat in a single query instead of
+        # loading every frame (and its image) of every threat
+        sample_frames = {}
+        if threats:
+            first_image_frame = db.session.query(
+                IncidentFrame.incident_id,
+                db.func.min(IncidentFrame.frame_number).label('frame_number')
+            ).filter(
+                IncidentFrame.incident_id.in_([threat.id for threat in threats]),
+                IncidentFrame.image_sha256.isnot(None)
+            ).group_by(IncidentFrame.incident_id).subquery()
+            
+            sample_frames = dict(db.session.query(IncidentFrame.incident_id, IncidentFrame.image_sha256).join(
+                first_image_frame,
+                db.and_(
+                    IncidentFrame.incident_id == first_image_frame.c.incident_id,
+                    IncidentFrame.frame_number == first_image_frame.c.frame_number
+                )
+            ).all())
         
         threat_data = []
+        now = datetime.utcnow()
         for threat in threats:
-            threat_dict = threat.to_dict()
+            threat_dict = threat.to_dict(now)
             # Include analyses for each threat
             threat_dict['analyses'] = [analysis.to_dict() for analysis in threat.gemini_analyses]
-            # Add a sample frame if available (using image_data field from IncidentFrame)
-            if threat.frames:
-                sample_frame = threat.frames[0]  # Get first frame as sample
-                threat_dict['sample_frame'] = sample_frame.image_data if hasattr(sample_frame, 'image_data') else None
-            else:
-                threat_dict['sample_frame'] = None
+            # Add a sample frame if available (first frame of the incident that has an image)
+            threat_dict['sample_frame_url'] = frame_url(sample_frames.get(threat.id))
             threat_data.append(threat_dict)
             print(f"   - Threat #{threat.id}: {threat.threat_explanation[:50] if threat.threat_explanation else 'No explanation'}...")
         
@@ -533,44 +785,70 @@ def get_threats():
         return jsonify({'error': str(e), 'threats': []}), 500
 
 @app.route('/api/sessions')
+@etag_cached
 def get_sessions():
     """Get all sessions"""
-    sessions = Session.query.order_by(Session.started_at.desc()).all()
-    return jsonify({'sessions': [session.to_dict() for session in sessions]})
+    return Response(sessions_json(), mimetype='application/json')
 
 @app.route('/api/sessions/<int:session_id>')
 def get_session_detail(session_id):
     """Get detailed session info with all incidents"""
-    session = Session.query.get(session_id)
+    session = db.session.get(Session, session_id, options=[selectinload(Session.incidents)])
     if not session:
         return jsonify({'error': 'Session not found'}), 404
     
-    session_data = session.to_dict()
-    session_data['incidents'] = [incident.to_dict() for incident in session.incidents]
+    now = datetime.utcnow()
+    session_data = session.to_dict(now)
+    session_data['incidents'] = [incident.to_dict(now) for incident in session.incidents]
     
     return jsonify({'session': session_data})
 
 @app.route('/api/incidents/<int:incident_id>')
 def get_incident_detail(incident_id):
-    """Get detailed incident info with all frames and analyses"""
-    incident = Incident.query.get(incident_id)
+    """Get detailed incident info with all frames and analyses (?hand_data=1 adds per-frame hand data)"""
+    include_hand_data = request.args.get('hand_data') == '1'
+    frames_loader = joinedload(Incident.frames)
+    if not include_hand_data:
+        frames_loader = frames_loader.defer(IncidentFrame.hand_data_bin)
+    
+    incident = db.session.get(Incident, incident_id, options=[
+        frames_loader,
+        selectinload(Incident.gemini_analyses),
+        selectinload(Incident.alerts)
+    ])
     if not incident:
         return jsonify({'error': 'Incident not found'}), 404
     
     incident_data = incident.to_dict()
-    incident_data['frames'] = [frame.to_dict() for frame in incident.frames]
+    incident_data['frames'] = [
+        frame.to_dict() if include_hand_data else frame.to_summary_dict()
+        for frame in incident.frames
+    ]
     incident_data['analyses'] = [analysis.to_dict() for analysis in incident.gemini_analyses]
     incident_data['alerts'] = [alert.to_dict() for alert in incident.alerts]
     
     return jsonify({'incident': incident_data})
 
+@app.route('/api/frames/<sha256>.jpg')
+def get_frame_image(sha256):
+    """Serve a stored incident frame (content-addressed, so cacheable forever)"""
+    if not FRAME_KEY_PATTERN.fullmatch(sha256):
+        abort(404)
+    path = frame_path(sha256)
+    if not os.path.exists(path):
+        abort(404)
+    # Set USE_X_SENDFILE behind a proxy to hand the file transfer off entirely
+    response = send_file(path, mimetype='image/jpeg', max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/api/session')
 def get_session():
     """Get current session info"""
     global current_session_id
     
     if current_session_id:
-        session = Session.query.get(current_session_id)
+        session = db.session.get(Session, current_session_id)
         if session:
             return jsonify({'session': session.to_dict()})
     
@@ -586,7 +864,6 @@ def get_session():
 def get_latest_results():
     """Get the latest photo analysis results"""
     global latest_results
-    print(f"🔍 DEBUG: Latest results requested - Photo #{latest_results['photo_count']}, Hands: {latest_results['hands_detected']}, Theft: {latest_results['theft_detected']}")
     return jsonify({
         'results': latest_results
     })
@@ -636,7 +913,6 @@ def get_hand_detection_data():
 def get_visualized_image():
     """Get the latest image with hand detections"""
     global latest_visualized_image
-    print(f"🔍 DEBUG: Visualized image requested, has_image: {latest_visualized_image is not None}")
     if latest_visualized_image:
         return jsonify({
             'image': latest_visualized_image,
@@ -652,63 +928,63 @@ def get_visualized_image():
 def detection_stream():
     """Stream MediaPipe hand detection processed frames using proper multi-threaded architecture"""
     def generate_detection_frames():
-        global detection_stream_active, video_capture_thread, detection_processing_thread
+        global detection_stream_active, video_capture_thread, detection_processing_thread, mjpeg_encoder_thread
+        global stream_viewers
         
-        # Start background threads if not already running
-        if not detection_stream_active:
-            detection_stream_active = True
-            print("🎥 Starting hand detection stream with proper multi-threading architecture")
-            
-            # Start video capture thread
-            video_capture_thread = threading.Thread(target=video_capture_worker, daemon=True)
-            video_capture_thread.start()
-            
-            # Start MediaPipe hand detection processing thread
-            detection_processing_thread = threading.Thread(target=detection_processing_worker, daemon=True)
-            detection_processing_thread.start()
-            
-            print("✅ Background threads started: Video capture + MediaPipe hand detection processing")
-        
-        # Stream processed frames from the queue
-        frame_count = 0
-        while detection_stream_active:
-            try:
-                # Get processed frame from queue (with timeout)
-                frame_id, processed_frame = processed_frame_queue.get(timeout=2.0)
-                frame_count += 1
+        # Start background threads if not already running (the lock keeps two clients
+        # connecting at once from both starting them)
+        with stream_start_lock:
+            stream_viewers += 1
+            if not detection_stream_active:
+                detection_stream_active = True
+                print("🎥 Starting hand detection stream with proper multi-threading architecture")
                 
-                # Encode frame as JPEG
-                _, buffer = cv2.imencode('.jpg', processed_frame)
-                frame_bytes = buffer.tobytes()
+                # Start video capture thread
+                video_capture_thread = threading.Thread(target=video_capture_worker, daemon=True)
+                video_capture_thread.start()
                 
-                # Yield MJPEG frame
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                # Start MediaPipe hand detection processing thread
+                detection_processing_thread = threading.Thread(target=detection_processing_worker, daemon=True)
+                detection_processing_thread.start()
                 
-                if frame_count % 30 == 0:  # Log every 30 frames
-                    print(f"📡 Streamed frame #{frame_count} (ID: {frame_id})")
+                # Start MJPEG encoder thread (one encode per frame, shared by all clients)
+                mjpeg_encoder_thread = threading.Thread(target=mjpeg_encoder_worker, daemon=True)
+                mjpeg_encoder_thread.start()
                 
-            except queue.Empty:
-                # No processed frames available, send placeholder
-                placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(placeholder, "Waiting for frames...", (150, 200), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-                cv2.putText(placeholder, f"Queue size: {processed_frame_queue.qsize()}", (150, 250), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
-                _, buffer = cv2.imencode('.jpg', placeholder)
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            except Exception as e:
-                print(f"❌ Error in detection stream: {e}")
-                # Send error frame
-                error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(error_frame, f"Stream Error: {str(e)[:50]}", (50, 200), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                _, buffer = cv2.imencode('.jpg', error_frame)
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                print("✅ Background threads started: Video capture + MediaPipe hand detection processing + MJPEG encoding")
+            
+        try:
+            # Stream the shared encoded frames, waiting for each new one
+            frame_count = 0
+            last_seq = latest_stream_part['seq']
+            while detection_stream_active:
+                try:
+                    with latest_stream_part['cv']:
+                        if latest_stream_part['cv'].wait_for(lambda: latest_stream_part['seq'] != last_seq, timeout=2.0):
+                            last_seq = latest_stream_part['seq']
+                            part = latest_stream_part['bytes']
+                            frame_id = latest_stream_part['frame_id']
+                        else:
+                            part = None
+                    
+                    if part is None:
+                        # No processed frames available, send placeholder
+                        yield placeholder_part(processed_frame_queue.qsize())
+                        continue
+                    
+                    frame_count += 1
+                    yield part
+                    
+                    if frame_count % 30 == 0:  # Log every 30 frames
+                        print(f"📡 Streamed frame #{frame_count} (ID: {frame_id})")
+                    
+                except Exception as e:
+                    print(f"❌ Error in detection stream: {e}")
+                    # Send error frame
+                    yield error_part(str(e)[:50])
+        finally:
+            with stream_start_lock:
+                stream_viewers -= 1
         
         print("🎥 Detection stream ended")
     
@@ -726,7 +1002,7 @@ def test_incident():
                 timestamp=time.time(),
                 confidence=85.0,
                 explanation="TEST: Hand detected reaching toward backpack - potential theft attempt",
-                images_data=json.dumps(["test_image_data"])
+                images_data=orjson.dumps(["test_image_data"]).decode()
             )
             
             db.session.add(incident)
@@ -759,7 +1035,7 @@ def test_gemini():
     print("🔍 DEBUG: Testing Gemini API...")
     try:
         # Create a simple test image
-        test_image = Image.new('RGB', (640, 480), color=(100, 100, 100))
+        test_image = np.full((480, 640, 3), 100, dtype=np.uint8)
         test_images = [test_image]
         
         is_theft, confidence, explanation = gemini_analyzer.analyze_theft_attempt(test_images)
@@ -780,7 +1056,8 @@ def test_audio():
     """Test ElevenLabs audio generation"""
     print("🔍 DEBUG: Testing ElevenLabs audio...")
     try:
-        audio_notifier.send_alert(85, "Test alert - system is working correctly")
+        # Wait here so the test reports when the alert is actually ready
+        audio_notifier.send_alert(85, "Test alert - system is working correctly").result(timeout=60)
         return jsonify({'status': 'success', 'message': 'Audio test completed'})
     except Exception as e:
         print(f"❌ ERROR in audio test: {e}")
@@ -1,210 +1,365 @@
 import os
+import re
 import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import base64
 from datetime import datetime
 
+# Read size for streamed ElevenLabs audio
+AUDIO_CHUNK_SIZE = 8192
+
+# Synthesized alerts are cached by message, in memory (LRU) and on disk
+TTS_CACHE_DIR = '.tts_cache'
+TTS_MEMORY_CACHE_SIZE = 64
+
+# Voice settings: steadier/closer to the voice for urgent alerts, neutral for tests
+ALERT_VOICE_SETTINGS = {"stability": 0.7, "similarity_boost": 0.75}
+TEST_VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.5}
+
+def create_http_session():
+    """Keep-alive HTTP session with pooled connections and retries on transient errors"""
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class AudioNotifier:
-    def __init__(self):
+    # Every alert is one of these fixed phrases, so they can all be synthesized ahead of time
+    _THREAT_PHRASES = (
+        "Someone is reaching toward your backpack. Check your belongings immediately.",
+        "Someone is grabbing your backpack. Check your belongings immediately.",
+        "Someone is touching your backpack. Check your belongings immediately.",
+        "Someone is opening your backpack. Check your belongings immediately.",
+        "Possible theft attempt detected. Check your belongings immediately.",
+        "Someone is tampering with your backpack. Check your belongings immediately.",
+        "Suspicious hand movement near your backpack. Check your belongings immediately.",
+        "Suspicious activity near your backpack. Check your belongings immediately.",
+    )
+    _TEST_PHRASE = "Security system activated. Backpack monitoring is now active."
+    
+    # Keyword group N selects _THREAT_PHRASES[N]; no match falls back to the generic last phrase
+    # (zero-width lookahead so overlapping keywords like "theftaking" are all seen)
+    _THREAT_RULES = re.compile(
+        r"(?=(reaching)|(grabbing|taking)|(touching)|(opening|unzipping)|(theft|stealing)"
+        r"|(tampering)|(suspicious hand|unauthorized))",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, session=None):
         """Initialize ElevenLabs for voice notifications"""
         self.api_key = os.getenv('ELEVENLABS_API_KEY')
         self.voice_id = os.getenv('ELEVENLABS_VOICE_ID', 'pNInz6obpgDQGcFmaJgB')  # Default voice
         self.base_url = "https://api.elevenlabs.io/v1"
+        self._tts_url = f"{self.base_url}/text-to-speech/{self.voice_id}"
+        
+        # Keep-alive session so each alert skips the TCP + TLS handshake.
+        # It may be shared with other clients, so ElevenLabs headers go on each request.
+        self._owns_http = session is None
+        self._http = session if session is not None else create_http_session()
+        self._tts_headers = {
+            "Accept": "audio/mpeg",
+            "Content-Type": "application/json",
+            "xi-api-key": self.api_key or ""
+        }
         
-        # Store latest alert for frontend to fetch
+        # TTS cache: the alert vocabulary is tiny, so repeats skip the API entirely
+        self._tts_memory = OrderedDict()
+        self._tts_lock = threading.Lock()
+        
+        # Store latest alert for frontend to fetch (written by the TTS worker threads)
         self.latest_alert = None
-        self.alert_timestamp = None
+        self._alert_mono = None  # time.monotonic() when latest_alert was published
+        self._latest_audio = None  # MP3 bytes of latest_alert until first fetched
+        self._alert_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='tts')
         
         if not self.api_key:
             print("❌ ELEVENLABS_API_KEY not found in environment variables")
             self.api_key = None
         else:
             print("🔊 ElevenLabs API initialized successfully")
+            # Synthesize the whole alert vocabulary in the background so real alerts never wait on the API
+            if not self._fully_cached():
+                self._executor.submit(self._prewarm_tts)
         
+    def _classify_threat(self, explanation):
+        """Index into _THREAT_PHRASES for the threat Gemini's explanation describes"""
+        # One scan over the text; if several keywords appear, the earliest rule wins
+        return min((match.lastindex - 1 for match in self._THREAT_RULES.finditer(explanation)),
+                   default=len(self._THREAT_PHRASES) - 1)
+    
     def _create_short_alert_message(self, confidence, explanation):
         """
         Create a SHORT, natural alert message from Gemini's potentially long explanation.
         Just describe what happened and tell user to check their things.
         """
-        # Extract key threat indicators from explanation
-        explanation_lower = explanation.lower()
+        return self._THREAT_PHRASES[self._classify_threat(explanation)]
+    
+    def __del__(self):
+        if getattr(self, '_owns_http', False):
+            self._http.close()
+    
+    def generate_theft_alert(self, confidence, explanation, message=None):
+        """
+        Generate audio alert for threat detection, yielding MP3 chunks as they arrive.
+        Creates a SHORT, descriptive message based on Gemini's analysis (unless one is passed in).
+        """
+        # Create SHORT alert message (not the full Gemini response)
+        if message is None:
+            message = self._create_short_alert_message(confidence, explanation)
+        yield from self._cached_tts(message, ALERT_VOICE_SETTINGS, explanation)
+    
+    def _cached_tts(self, message, voice_settings, explanation=None):
+        """Yield audio for message from the TTS cache, falling back to ElevenLabs"""
+        key = self._tts_key(message, voice_settings)
+        cached = self._lookup_tts(key)
+        if cached is not None:
+            print(f"🔊 Using cached audio alert: {message}")
+            yield cached
+            return
         
-        # Determine threat description based on keywords
-        if "reaching" in explanation_lower or "hand reaching" in explanation_lower:
-            threat_description = "Someone is reaching toward your backpack"
-        elif "grabbing" in explanation_lower or "taking" in explanation_lower:
-            threat_description = "Someone is grabbing your backpack"
-        elif "touching" in explanation_lower:
-            threat_description = "Someone is touching your backpack"
-        elif "opening" in explanation_lower or "unzipping" in explanation_lower:
-            threat_description = "Someone is opening your backpack"
-        elif "theft" in explanation_lower or "stealing" in explanation_lower:
-            threat_description = "Possible theft attempt detected"
-        elif "tampering" in explanation_lower:
-            threat_description = "Someone is tampering with your backpack"
-        elif "suspicious hand" in explanation_lower or "unauthorized" in explanation_lower:
-            threat_description = "Suspicious hand movement near your backpack"
-        else:
-            # Generic threat message
-            threat_description = "Suspicious activity near your backpack"
+        if not self.api_key:
+            print("⚠️ ElevenLabs not available, using simulation")
+            yield self._simulate_audio()
+            return
+        
+        print(f"🔊 Generating SHORT audio alert: {message}")
+        if explanation is not None:
+            print(f"   (Original Gemini explanation was {len(explanation)} chars)")
         
-        # Create short, natural message
-        message = f"{threat_description}. Check your belongings immediately."
+        yield from self._stream_tts(message, voice_settings, cache_key=key)
+    
+    def _tts_key(self, message, voice_settings):
+        """Cache key for one synthesized message in the current voice"""
+        raw = f"{self.voice_id}|{voice_settings['stability']}|{voice_settings['similarity_boost']}|{message}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _lookup_tts(self, key):
+        """Return cached MP3 bytes for key (memory first, then disk), or None"""
+        with self._tts_lock:
+            audio = self._tts_memory.get(key)
+            if audio is not None:
+                self._tts_memory.move_to_end(key)
+                return audio
+        
+        path = os.path.join(TTS_CACHE_DIR, f"{key}.mp3")
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+        except OSError:
+            return None
         
-        return message
+        self._remember_tts(key, audio)
+        return audio
+    
+    def _remember_tts(self, key, audio):
+        """Insert into the in-memory LRU, evicting the oldest entry when full"""
+        with self._tts_lock:
+            self._tts_memory[key] = audio
+            self._tts_memory.move_to_end(key)
+            if len(self._tts_memory) > TTS_MEMORY_CACHE_SIZE:
+                self._tts_memory.popitem(last=False)
+    
+    def _store_tts(self, key, audio):
+        """Cache freshly synthesized audio in memory and on disk"""
+        self._remember_tts(key, audio)
+        try:
+            os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+            tmp_path = os.path.join(TTS_CACHE_DIR, f"{key}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, os.path.join(TTS_CACHE_DIR, f"{key}.mp3"))
+        except OSError as e:
+            print(f"⚠️ Could not write TTS cache: {e}")
+    
+    def _fully_cached(self):
+        """True if every alert phrase and the test phrase are already cached"""
+        return (all(self.is_tts_cached(phrase) for phrase in self._THREAT_PHRASES)
+                and self.is_tts_cached(self._TEST_PHRASE, TEST_VOICE_SETTINGS))
     
-    def generate_theft_alert(self, confidence, explanation):
+    def _prewarm_tts(self):
+        """Synthesize and cache any alert phrase that isn't cached yet"""
+        phrases = [(phrase, ALERT_VOICE_SETTINGS) for phrase in self._THREAT_PHRASES]
+        phrases.append((self._TEST_PHRASE, TEST_VOICE_SETTINGS))
+        for phrase, voice_settings in phrases:
+            if self.is_tts_cached(phrase, voice_settings):
+                continue
+            try:
+                for _ in self._stream_tts(phrase, voice_settings, cache_key=self._tts_key(phrase, voice_settings)):
+                    pass
+            except Exception:
+                # Left uncached; the next alert for this phrase synthesizes it again
+                continue
+        if self._fully_cached():
+            print("🔊 Alert phrases cached")
+        else:
+            print("⚠️ Some alert phrases could not be cached")
+    
+    def is_tts_cached(self, message, voice_settings=ALERT_VOICE_SETTINGS):
+        """True if audio for message is already in the memory or disk cache"""
+        key = self._tts_key(message, voice_settings)
+        with self._tts_lock:
+            if key in self._tts_memory:
+                return True
+        return os.path.exists(os.path.join(TTS_CACHE_DIR, f"{key}.mp3"))
+    
+    def _tts(self, text, voice_settings):
+        """POST text to the ElevenLabs text-to-speech endpoint over the shared session"""
+        body = orjson.dumps({
+            "text": text,
+            "model_id": "eleven_monolingual_v1",
+            "voice_settings": voice_settings
+        })
+        return self._http.post(self._tts_url, data=body, headers=self._tts_headers, stream=True, timeout=(3, 30))
+    
+    def _stream_tts(self, text, voice_settings, cache_key=None):
         """
-        Generate and return audio alert for threat detection.
-        Creates a SHORT, descriptive message based on Gemini's analysis.
+        Yield MP3 chunks from ElevenLabs without buffering the whole response
+        
+        Only a complete response is cached. If the stream breaks after chunks were
+        yielded the error is re-raised, so callers drop the truncated audio.
         """
-        if not self.api_key:
-            print("⚠️ ElevenLabs not available, using simulation")
-            return self._simulate_audio()
-            
+        started = False
+        chunks = []
         try:
-            # Create SHORT alert message (not the full Gemini response)
-            message = self._create_short_alert_message(confidence, explanation)
-            
-            print(f"🔊 Generating SHORT audio alert: {message}")
-            print(f"   (Original Gemini explanation was {len(explanation)} chars)")
-            
-            # Generate audio using ElevenLabs API
-            url = f"{self.base_url}/text-to-speech/{self.voice_id}"
-            
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key
-            }
-            
-            data = {
-                "text": message,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.7,      # Higher stability for clearer urgent message
-                    "similarity_boost": 0.75  # Higher similarity for consistency
-                }
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
-            
-            if response.status_code == 200:
-                print("✅ Audio generated successfully")
-                return response.content
-            else:
-                print(f"❌ ElevenLabs API error: {response.status_code}")
-                return self._simulate_audio()
+            with self._tts(text, voice_settings) as response:
+                if response.status_code != 200:
+                    print(f"❌ ElevenLabs API error: {response.status_code}")
+                    yield self._simulate_audio()
+                    return
+                
+                print("✅ Audio stream started")
+                for chunk in response.iter_content(AUDIO_CHUNK_SIZE):
+                    started = True
+                    chunks.append(chunk)
+                    yield chunk
             
+            # Only complete responses are cached
+            if cache_key is not None and chunks:
+                self._store_tts(cache_key, b''.join(chunks))
         except Exception as e:
             print(f"❌ Error generating audio alert: {e}")
-            return self._simulate_audio()
+            # A half-played alert can't be patched up; only fall back if nothing was sent yet
+            if started:
+                raise
+            yield self._simulate_audio()
     
     def _simulate_audio(self):
         """Simulate audio generation when ElevenLabs is not available"""
         print("🔊 [SIMULATED] Audio alert would play here")
         return b"simulated_audio"
     
-    def play_alert(self, audio_data):
-        """Play audio alert"""
+    def play_alert(self, audio):
+        """Play audio alert by piping MP3 bytes (or an iterator of chunks) into mpg123"""
         try:
-            if audio_data == b"simulated_audio":
+            if audio == b"simulated_audio":
                 print("🔊 [SIMULATED] Playing audio alert...")
-                time.sleep(2)  # Simulate audio duration
                 return
-                
-            # For real implementation, you would use pygame or similar
+            if isinstance(audio, bytes):
+                audio = (audio,)
+            
+            player = shutil.which('mpg123')
+            if player is None:
+                print("⚠️ mpg123 not installed - skipping local playback")
+                return
+            
             print("🔊 Playing audio alert...")
-            time.sleep(2)  # Simulate audio duration
+            proc = subprocess.Popen([player, '-q', '-'], stdin=subprocess.PIPE)
+            for chunk in audio:
+                if chunk == b"simulated_audio":
+                    print("🔊 [SIMULATED] Playing audio alert...")
+                    break
+                proc.stdin.write(chunk)
+            proc.stdin.close()
+            proc.wait()
             print("✅ Audio playback complete")
             
         except Exception as e:
             print(f"❌ Error playing audio: {e}")
     
     def send_alert(self, confidence, explanation):
-        """Generate audio alert and make it available for frontend"""
+        """Queue an audio alert for the frontend; returns a Future so callers never wait on TTS"""
         print(f"🚨 Sending REAL-TIME audio alert: {confidence}% - {explanation[:100]}...")
         
         # Generate SHORT message for audio and display
         short_message = self._create_short_alert_message(confidence, explanation)
         
-        # Generate audio with short message
-        audio_data = self.generate_theft_alert(confidence, explanation)
-        
-        if audio_data and audio_data != b"simulated_audio":
-            # Convert to base64 for frontend consumption
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            self.latest_alert = {
-                'audio': audio_base64,
-                'confidence': confidence,
-                'short_message': short_message,  # SHORT message for display
-                'full_explanation': explanation,  # Full explanation for reference
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            self.alert_timestamp = datetime.utcnow()
-            print(f"✅ Audio alert ready for frontend (size: {len(audio_data)} bytes)")
-            print(f"   Short message: {short_message}")
-        else:
-            print("❌ Failed to generate audio alert")
+        return self._executor.submit(self._generate_and_store, confidence, explanation, short_message)
+    
+    def _generate_and_store(self, confidence, explanation, short_message):
+        """Worker: synthesize the alert and publish it as latest_alert"""
+        try:
+            # The frontend plays the alert from one base64 blob, so gather the streamed chunks
+            # (a stream that breaks partway raises here, so a truncated clip is never published)
+            served_from_cache = self.is_tts_cached(short_message)
+            audio_data = b''.join(self.generate_theft_alert(confidence, explanation, message=short_message))
+            
+            if audio_data and audio_data != b"simulated_audio":
+                with self._alert_lock:
+                    # Keep raw bytes; base64 for the frontend is produced on first fetch
+                    self._latest_audio = audio_data
+                    self.latest_alert = {
+                        'audio': None,
+                        'confidence': confidence,
+                        'short_message': short_message,  # SHORT message for display
+                        'full_explanation': explanation,  # Full explanation for reference
+                        'served_from_cache': served_from_cache,
+                        'timestamp': datetime.utcnow().isoformat()
+                    }
+                    self._alert_mono = time.monotonic()
+                print(f"✅ Audio alert ready for frontend (size: {len(audio_data)} bytes)")
+                print(f"   Short message: {short_message}")
+            else:
+                print("❌ Failed to generate audio alert")
+        except Exception as e:
+            print(f"❌ Error generating audio alert: {e}")
     
     def get_latest_alert(self):
         """
         Get the latest alert for frontend consumption.
         Returns None if alert is older than 15 seconds (real-time only).
         """
-        if not self.latest_alert or not self.alert_timestamp:
-            return None
-        
-        # Check if alert is still fresh (within 15 seconds)
-        age_seconds = (datetime.utcnow() - self.alert_timestamp).total_seconds()
-        
-        if age_seconds > 15:
-            # Alert is too old - clear it and return None
-            print(f"⚠️  Alert expired ({age_seconds:.1f}s old) - clearing")
-            self.clear_alert()
-            return None
-        
-        return self.latest_alert
+        with self._alert_lock:
+            if not self.latest_alert or self._alert_mono is None:
+                return None
+            
+            # Check if alert is still fresh (within 15 seconds); monotonic so clock changes can't skew it
+            age_seconds = time.monotonic() - self._alert_mono
+            
+            if age_seconds > 15:
+                # Alert is too old - clear it and return None
+                print(f"⚠️  Alert expired ({age_seconds:.1f}s old) - clearing")
+                self.latest_alert = None
+                self._alert_mono = None
+                self._latest_audio = None
+                return None
+            
+            # Encode once, on the first poll that actually wants the alert
+            if self.latest_alert['audio'] is None:
+                self.latest_alert['audio'] = base64.b64encode(self._latest_audio).decode('utf-8')
+                self._latest_audio = None
+            
+            return self.latest_alert
     
     def clear_alert(self):
         """Clear the current alert after it's been played"""
-        self.latest_alert = None
-        self.alert_timestamp = None
+        with self._alert_lock:
+            self.latest_alert = None
+            self._alert_mono = None
+            self._latest_audio = None
     
     def generate_test_alert(self):
         """Generate a test alert for system verification"""
-        try:
-            message = "Security system activated. Backpack monitoring is now active."
-            
-            if not self.api_key:
-                print("⚠️ ElevenLabs not available, using simulation")
-                return self._simulate_audio()
-            
-            url = f"{self.base_url}/text-to-speech/{self.voice_id}"
-            
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key
-            }
-            
-            data = {
-                "text": message,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.5
-                }
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                return self._simulate_audio()
-            
-        except Exception as e:
-            print(f"❌ Error generating test alert: {e}")
-            return self._simulate_audio()
+        return b''.join(self._cached_tts(self._TEST_PHRASE, TEST_VOICE_SETTINGS))
@@ -0,0 +1,56 @@
+"""
+Row-based JSON serialization for the dashboard's list endpoints
+
+The list routes are polled constantly, so instead of hydrating ORM objects and
+calling to_dict() on each, they select just the serialized columns (durations are
+computed by SQLite) and encode the plain rows with orjson (datetimes are formatted
+in C, matching isoformat()).
+"""
+
+import orjson
+from models import db, Session, Incident
+
+
+def _duration_seconds(model):
+    """SQL expression for the models' duration rule (open rows run until now), in seconds"""
+    ended = db.func.coalesce(model.ended_at, db.literal('now'))
+    return db.func.coalesce(
+        (db.func.julianday(ended) - db.func.julianday(model.started_at)) * 86400.0, 0
+    ).label('duration_seconds')
+
+
+SESSION_FIELDS = (
+    Session.id, Session.started_at, Session.ended_at, Session.is_active,
+    Session.total_frames, Session.total_incidents, Session.total_escalations, Session.has_threat,
+    Session.last_threat_at, _duration_seconds(Session)
+)
+
+INCIDENT_FIELDS = (
+    Incident.id, Incident.session_id, Incident.started_at, Incident.ended_at, Incident.is_active,
+    Incident.total_frames, Incident.max_hand_count, Incident.max_confidence, Incident.is_escalated,
+    Incident.gemini_analyzed, Incident.threat_detected, Incident.threat_confidence,
+    Incident.threat_explanation, Incident.latest_gemini_analysis_id, Incident.user_alerted,
+    Incident.alert_sent_at, _duration_seconds(Incident)
+)
+
+
+def _rows_json(key, fields, rows):
+    """Encode rows as {key: [{field: value, ...}]}"""
+    names = [field.key for field in fields]
+    return orjson.dumps({key: [dict(zip(names, row)) for row in rows]})
+
+
+def sessions_json():
+    """All sessions, newest first, as /api/sessions JSON bytes"""
+    rows = db.session.execute(
+        db.select(*SESSION_FIELDS).order_by(Session.started_at.desc())
+    ).all()
+    return _rows_json('sessions', SESSION_FIELDS, rows)
+
+
+def incidents_json(limit=20):
+    """Most recent incidents as /api/incidents JSON bytes"""
+    rows = db.session.execute(
+        db.select(*INCIDENT_FIELDS).order_by(Incident.started_at.desc()).limit(limit)
+    ).all()
+    return _rows_json('incidents', INCIDENT_FIELDS, rows)
@@ -0,0 +1,57 @@
+"""
+Content-addressed storage for incident frame JPEGs
+
+Frames are written once to frames/<sha[:2]>/<sha>.jpg and referenced from the
+database by their SHA-256, so identical frames (a still background) share one file.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+# Anchored next to this module (like the app's instance/ database), not the working directory,
+# so the app, gunicorn and migrate_database.py all read and write the same tree
+FRAME_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frames')
+
+# Only full lowercase hex digests are valid keys (also keeps URLs out of the filesystem)
+FRAME_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+def frame_path(sha256):
+    """Absolute path of the stored JPEG for a frame hash"""
+    return os.path.join(FRAME_STORE_DIR, sha256[:2], f"{sha256}.jpg")
+
+
+def save_frame(jpeg_bytes):
+    """Store JPEG bytes or any bytes-like buffer (skipped if already present) and return their SHA-256"""
+    sha256 = hashlib.sha256(jpeg_bytes).hexdigest()
+    path = frame_path(sha256)
+    if os.path.exists(path):
+        return sha256
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(jpeg_bytes)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256
+
+
+def load_frame(sha256):
+    """JPEG bytes for a frame hash, or None if the file is missing"""
+    try:
+        with open(frame_path(sha256), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def frame_url(sha256):
+    """URL the dashboard uses to fetch a stored frame"""
+    return f"/api/frames/{sha256}.jpg" if sha256 else None
@@ -1,13 +1,36 @@
 import google.generativeai as genai
 import base64
-import io
-from PIL import Image
 import os
-import json
+import orjson
+import threading
+import time
+import numpy as np
+import cv2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Gemini downsamples large images itself, so send smaller, lighter JPEGs
+GEMINI_MAX_IMAGE_SIZE = (1024, 1024)
+GEMINI_JPEG_QUALITY = 60
+
+# Recent analyses keyed by incident and the batch's perceptual hashes; later batches of the
+# same incident whose hashes all differ by fewer than ANALYSIS_CACHE_MAX_DISTANCE bits reuse
+# the cached answer (other incidents never do, their frames must be seen by Gemini)
+ANALYSIS_CACHE_SIZE = 32
+ANALYSIS_CACHE_MAX_DISTANCE = 6
+# Cached answers expire so a stale "no threat" is re-checked with Gemini
+ANALYSIS_CACHE_TTL_SECONDS = 300
 
 class GeminiAnalyzer:
     def __init__(self):
         """Initialize Gemini API"""
+        # OpenCV releases the GIL while encoding, so batch images encode in parallel
+        self._encode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='gemini-encode')
+        
+        # Still scenes produce near-identical batches, so remember recent answers
+        self._analysis_cache = OrderedDict()
+        self._analysis_cache_lock = threading.Lock()
+        
         try:
             api_key = os.getenv('GEMINI_API_KEY')
             if not api_key:
@@ -16,17 +39,23 @@ class GeminiAnalyzer:
                 return
                 
             genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-pro')
+            # Ask for a bare JSON response so parsing is a single orjson.loads
+            self.model = genai.GenerativeModel(
+                'gemini-2.5-pro',
+                generation_config={"response_mime_type": "application/json"}
+            )
             print("🤖 Gemini API initialized successfully")
         except Exception as e:
             print(f"❌ Error initializing Gemini: {e}")
             self.model = None
         
-    def analyze_theft_attempt(self, image_batch):
+    def analyze_theft_attempt(self, image_batch, incident_id=None):
         """
         Analyze a batch of images for theft attempts using Gemini
         Args:
-            image_batch: List of PIL Images
+            image_batch: List of JPEG bytes (sent as-is) or BGR frames (numpy arrays)
+            incident_id: Incident the batch belongs to; results are only reused within it
+                (no caching when None)
         Returns:
             (is_theft, confidence, explanation)
         """
@@ -35,20 +64,17 @@ class GeminiAnalyzer:
             return self._simulate_analysis()
             
         try:
+            batch_key = self._batch_key(image_batch, incident_id)
+            cached = self._lookup_analysis(batch_key) if batch_key is not None else None
+            if cached is not None:
+                print(f"♻️ Reusing Gemini analysis for a near-identical batch of {len(image_batch)} images")
+                return cached
+            
             print(f"🔍 Analyzing {len(image_batch)} images with Gemini...")
             
             # Prepare images for Gemini
-            images_for_analysis = []
-            for i, img in enumerate(image_batch):
-                # Convert PIL to bytes
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='JPEG')
-                img_bytes = img_buffer.getvalue()
-                images_for_analysis.append({
-                    "mime_type": "image/jpeg",
-                    "data": img_bytes
-                })
-                print(f"📸 Prepared image {i+1} for analysis")
+            images_for_analysis = list(self._encode_pool.map(self._encode_image, image_batch))
+            print(f"📸 Prepared {len(images_for_analysis)} images for analysis")
             
             # Create prompt for theft detection
             prompt = """
@@ -73,11 +99,17 @@ class GeminiAnalyzer:
             }
             """
             
-            # Send to Gemini
-            response = self.model.generate_content([prompt] + images_for_analysis)
+            # Send to Gemini, streaming so we can stop reading once the verdict is complete
+            response = self.model.generate_content([prompt] + images_for_analysis, stream=True)
             
-            # Parse response
-            result = self._parse_gemini_response(response.text)
+            # Parse response; only a real JSON verdict is worth reusing for similar batches
+            response_text = self._read_until_json(response)
+            result = self._verdict_from_json(response_text)
+            if result is not None:
+                if batch_key is not None:
+                    self._store_analysis(batch_key, result)
+            else:
+                result = self._parse_gemini_response(response_text)
             print(f"✅ Gemini analysis complete: {result[1]}% confidence")
             return result
             
@@ -85,6 +117,74 @@ class GeminiAnalyzer:
             print(f"❌ Error in Gemini analysis: {e}")
             return self._simulate_analysis()
     
+    def _batch_key(self, image_batch, incident_id):
+        """(incident_id, sorted perceptual hashes) of a batch, or None if it can't be cached"""
+        if incident_id is None:
+            return None
+        hashes = [self._dhash(img) for img in image_batch]
+        if None in hashes:
+            return None
+        return incident_id, tuple(sorted(hashes))
+    
+    def _dhash(self, img):
+        """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail (None if undecodable)"""
+        if isinstance(img, bytes):
+            # 1/8-scale grayscale decode is all a 9x8 thumbnail needs
+            gray = cv2.imdecode(np.frombuffer(img, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if gray is None:
+                return None
+        else:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        pixels = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    
+    def _lookup_analysis(self, batch_key):
+        """Cached result for an identical or perceptually similar batch, or None"""
+        with self._analysis_cache_lock:
+            # Drop expired answers first (oldest stored entries come first)
+            now = time.monotonic()
+            for key in [key for key, (_, stored_at) in self._analysis_cache.items()
+                        if now - stored_at > ANALYSIS_CACHE_TTL_SECONDS]:
+                del self._analysis_cache[key]
+            
+            entry = self._analysis_cache.get(batch_key)
+            if entry is not None:
+                self._analysis_cache.move_to_end(batch_key)
+                return entry[0]
+            
+            incident_id, hashes = batch_key
+            for key, (result, _) in self._analysis_cache.items():
+                if key[0] == incident_id and len(key[1]) == len(hashes) and all(
+                    bin(a ^ b).count('1') < ANALYSIS_CACHE_MAX_DISTANCE for a, b in zip(key[1], hashes)
+                ):
+                    self._analysis_cache.move_to_end(key)
+                    return result
+        return None
+    
+    def _store_analysis(self, batch_key, result):
+        """Remember a Gemini result, evicting the least recently used entry when full"""
+        with self._analysis_cache_lock:
+            self._analysis_cache[batch_key] = (result, time.monotonic())
+            self._analysis_cache.move_to_end(batch_key)
+            if len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+                self._analysis_cache.popitem(last=False)
+    
+    def _encode_image(self, img):
+        """Encode a BGR frame as a downscaled JPEG part for Gemini (JPEG bytes pass through)"""
+        if isinstance(img, bytes):
+            return {"mime_type": "image/jpeg", "data": img}
+        
+        h, w = img.shape[:2]
+        scale = max(GEMINI_MAX_IMAGE_SIZE) / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, GEMINI_JPEG_QUALITY])
+        return {
+            "mime_type": "image/jpeg",
+            "data": buffer.tobytes()
+        }
+    
     def _simulate_analysis(self):
         """Fallback simulation when Gemini is not available"""
         import random
@@ -98,25 +198,80 @@ class GeminiAnalyzer:
         
         return random.choice(scenarios)
     
-    def _parse_gemini_response(self, response_text):
-        """Parse Gemini response to extract structured data"""
+    def _read_until_json(self, stream):
+        """Accumulate streamed text, returning as soon as it holds a complete JSON object"""
+        parts = []
+        for chunk in stream:
+            parts.append(chunk.text)
+            text = ''.join(parts)
+            json_str = self._extract_json_object(text)
+            if json_str is not None:
+                try:
+                    orjson.loads(json_str)
+                    return json_str
+                except orjson.JSONDecodeError:
+                    pass
+        return ''.join(parts)
+    
+    def _extract_json_object(self, text):
+        """Return the first balanced {...} in text (ignoring braces inside strings), or None"""
+        start = text.find('{')
+        if start == -1:
+            return None
+        
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        return None
+    
+    def _verdict_from_json(self, response_text):
+        """(is_theft, confidence, explanation) from a JSON verdict in the response, or None"""
+        # The model is asked for pure JSON; otherwise pull the first balanced object out of the text
+        data = None
         try:
-            # Try to extract JSON from response
-            import re
-            
-            # Look for JSON in the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
+            data = orjson.loads(response_text)
+        except orjson.JSONDecodeError:
+            json_str = self._extract_json_object(response_text)
+            if json_str is not None:
                 try:
-                    data = json.loads(json_str)
-                    return (
-                        data.get('suspicious', False),
-                        int(data.get('confidence', 50)),
-                        data.get('explanation', response_text)
-                    )
-                except json.JSONDecodeError:
+                    data = orjson.loads(json_str)
+                except orjson.JSONDecodeError:
                     pass
+        
+        if not isinstance(data, dict):
+            return None
+        try:
+            return (
+                data.get('suspicious', False),
+                int(data.get('confidence', 50)),
+                data.get('explanation', response_text)
+            )
+        except (TypeError, ValueError):
+            return None
+    
+    def _parse_gemini_response(self, response_text):
+        """Parse Gemini response to extract structured data"""
+        try:
+            verdict = self._verdict_from_json(response_text)
+            if verdict is not None:
+                return verdict
             
             # Fallback to line-by-line parsing
             lines = response_text.strip().split('\n')
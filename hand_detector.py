@@ -2,44 +2,87 @@ import cv2
 import numpy as np
 import time
 import requests
-from PIL import Image
-import io
 import mediapipe as mp
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Burst capture: frames whose 32x32 thumbnails differ from the last kept frame by less
+# than this mean absolute difference are dropped, once the minimum has been reached
+MOTION_DIFF_THRESHOLD = 4.0
+MIN_CAPTURED_IMAGES = 2
+ENOUGH_CAPTURED_IMAGES = 3
+
+# Warmup: a few blank frames at the stream's resolution so the first real frame
+# doesn't pay for MediaPipe's graph start-up and allocations
+WARMUP_FRAME_SHAPE = (480, 640, 3)
+WARMUP_RUNS = 3
+
+# Frames wider than this are downscaled before MediaPipe (its palm model runs at 192x192
+# anyway); landmarks come back normalized, so boxes are still in full-frame pixels
+DETECTION_INPUT_WIDTH = 320
 
 class HandDetector:
-    def __init__(self, confidence_threshold=0.5):
+    def __init__(self, confidence_threshold=0.5, session=None, model_complexity=0):
         """Initialize MediaPipe for hand detection"""
+        # Keep-alive session for camera snapshots (shared with the app when provided)
+        self._owns_http = session is None
+        self.session = session if session is not None else requests.Session()
+        
+        # Downscale and RGB conversion buffers, reused across frames of the same size
+        self._small_buf = None
+        self._rgb_buf = None
+        
         try:
             # Initialize MediaPipe hands
             self.mp_hands = mp.solutions.hands
             self.hands = self.mp_hands.Hands(
                 static_image_mode=False,
                 max_num_hands=2,  # Detect up to 2 hands
+                model_complexity=model_complexity,  # 0 = lite model, ~2x faster on the Pi CPU
                 min_detection_confidence=confidence_threshold,
                 min_tracking_confidence=0.5
             )
             self.mp_drawing = mp.solutions.drawing_utils
             self.confidence_threshold = confidence_threshold
-            print(f"🤖 MediaPipe hand detector initialized with confidence threshold {confidence_threshold}")
+            print(f"🤖 MediaPipe hand detector initialized with confidence threshold {confidence_threshold}, model complexity {model_complexity}")
         except Exception as e:
             print(f"❌ Error initializing MediaPipe: {e}")
             self.hands = None
         
+    def warmup(self, shape=WARMUP_FRAME_SHAPE, runs=WARMUP_RUNS):
+        """Run a few dummy detections so start-up cost isn't paid on the first live frame"""
+        if self.hands is None:
+            return
+        try:
+            blank = np.zeros(shape, dtype=np.uint8)
+            start = time.time()
+            for _ in range(runs):
+                self.detect_hands(blank)  # Also sizes the downscale and RGB buffers
+            # Blank frames have no hands, so no tracking state carries over to live frames
+            print(f"🤖 Hand detector warmed up in {(time.time() - start) * 1000:.0f}ms")
+        except Exception as e:
+            print(f"⚠️ Hand detector warmup failed: {e}")
+    
+    def __del__(self):
+        if getattr(self, '_owns_http', False):
+            self.session.close()
+    
     def detect_hands_from_camera(self, camera_url):
         """
         Detect hands from Pi camera feed
-        Returns: (hands_detected, image_with_detections)
+        Returns: (hands_detected, image_with_detections); the image is half resolution when no hands are found
         """
         try:
             # Get image from Pi camera
-            response = requests.get(camera_url, timeout=5)
+            response = self.session.get(camera_url, timeout=5)
             if response.status_code != 200:
                 print(f"❌ Camera request failed: {response.status_code}")
                 return False, None
             
-            # Convert to OpenCV format
+            # Convert to OpenCV format, decoding at half resolution (DCT-domain scaling in libjpeg)
+            # since MediaPipe doesn't need full resolution to find hands
             image_array = np.frombuffer(response.content, dtype=np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            image = cv2.imdecode(image_array, cv2.IMREAD_REDUCED_COLOR_2)
             
             if image is None:
                 print("❌ Failed to decode camera image")
@@ -48,9 +91,13 @@ class HandDetector:
             # Detect hands
             has_hand, confidence, hands = self.detect_hands(image)
             
-            # Draw detections
+            # Draw detections on a full-resolution decode
             if has_hand:
-                image = self.draw_detections(image, hands)
+                full_image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+                scale = full_image.shape[1] / image.shape[1]
+                for hand in hands:
+                    hand['bbox'] = tuple(int(v * scale) for v in hand['bbox'])
+                image = self.draw_detections(full_image, hands)
                 print(f"🖐️ Detected {len(hands)} hands with confidence {confidence:.2f}")
                 return True, image
             else:
@@ -70,11 +117,27 @@ class HandDetector:
             return False, 0, []
             
         try:
-            # Convert BGR to RGB for MediaPipe
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Downscale large frames for MediaPipe into a reused buffer
+            h, w, _ = frame.shape
+            source = frame
+            if w > DETECTION_INPUT_WIDTH:
+                small_shape = (h * DETECTION_INPUT_WIDTH // w, DETECTION_INPUT_WIDTH, 3)
+                if self._small_buf is None or self._small_buf.shape != small_shape:
+                    self._small_buf = np.empty(small_shape, dtype=np.uint8)
+                source = cv2.resize(frame, (small_shape[1], small_shape[0]), dst=self._small_buf,
+                                    interpolation=cv2.INTER_AREA)
             
-            # Process the frame
-            results = self.hands.process(rgb_frame)
+            # Convert BGR to RGB for MediaPipe into a reused buffer
+            if self._rgb_buf is None or self._rgb_buf.shape != source.shape:
+                self._rgb_buf = np.empty_like(source)
+            rgb_frame = cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+            
+            # Process the frame (read-only input lets MediaPipe skip its internal copy)
+            rgb_frame.flags.writeable = False
+            try:
+                results = self.hands.process(rgb_frame)
+            finally:
+                rgb_frame.flags.writeable = True
             
             hands_detected = []
             max_confidence = 0
@@ -89,20 +152,15 @@ class HandDetector:
                         # Get hand landmarks
                         landmarks = results.multi_hand_landmarks[idx]
                         
-                        # Calculate bounding box from landmarks
-                        h, w, _ = frame.shape
-                        x_coords = [landmark.x for landmark in landmarks.landmark]
-                        y_coords = [landmark.y for landmark in landmarks.landmark]
+                        # Calculate bounding box from landmarks (normalized, so scale by the full frame)
+                        points = np.array([(landmark.x, landmark.y) for landmark in landmarks.landmark])
                         
                         # Convert normalized coordinates to pixel coordinates
-                        x_coords = [int(x * w) for x in x_coords]
-                        y_coords = [int(y * h) for y in y_coords]
+                        pixels = (points * (w, h)).astype(np.int32)
                         
-                        # Calculate bounding box
-                        x1 = max(0, min(x_coords) - 20)  # Add padding
-                        y1 = max(0, min(y_coords) - 20)
-                        x2 = min(w, max(x_coords) + 20)
-                        y2 = min(h, max(y_coords) + 20)
+                        # Calculate bounding box (with padding)
+                        x1, y1 = (int(v) for v in np.maximum(0, pixels.min(axis=0) - 20))
+                        x2, y2 = (int(v) for v in np.minimum((w, h), pixels.max(axis=0) + 20))
                         
                         hands_detected.append({
                             'confidence': confidence,
@@ -122,31 +180,63 @@ class HandDetector:
     
     def capture_suspicious_images(self, camera_url, num_images=5):
         """
-        Capture multiple images when hands are detected
-        Returns: list of images (PIL format)
+        Capture multiple images when hands are detected, skipping near-duplicate frames
+        Returns: list of images (raw JPEG bytes from the camera, ready for Gemini)
         """
-        images = []
-        print(f"📸 Capturing {num_images} suspicious images...")
+        print(f"📸 Capturing up to {num_images} suspicious images...")
         
-        for i in range(num_images):
-            try:
-                response = requests.get(camera_url, timeout=5)
-                if response.status_code == 200:
-                    # Convert to PIL Image
-                    image = Image.open(io.BytesIO(response.content))
-                    images.append(image)
-                    print(f"📸 Captured image {i+1}/{num_images}")
-                else:
-                    print(f"❌ Failed to capture image {i+1}")
-                    
-            except Exception as e:
-                print(f"❌ Error capturing image {i+1}: {e}")
+        # Requests start 0.5s apart as before, but overlap instead of queueing behind each other
+        stop = threading.Event()
+        images = []
+        last_thumb = None
+        with ThreadPoolExecutor(max_workers=num_images) as executor:
+            futures = [executor.submit(self._capture_one, camera_url, i, num_images, i * 0.5, stop)
+                       for i in range(num_images)]
             
-            # Small delay between captures
-            time.sleep(0.5)
+            for future in futures:
+                image = future.result()
+                if image is None:
+                    continue
+                
+                # Only keep frames that differ from the last kept one (but always keep a minimum)
+                thumb = self._motion_thumbnail(image)
+                if (last_thumb is not None and len(images) >= MIN_CAPTURED_IMAGES
+                        and np.abs(thumb - last_thumb).mean() < MOTION_DIFF_THRESHOLD):
+                    print("📸 Skipping near-duplicate image")
+                    continue
+                
+                images.append(image)
+                last_thumb = thumb
+                
+                # Enough distinct views; cancel the captures that haven't fired yet
+                if len(images) >= ENOUGH_CAPTURED_IMAGES:
+                    stop.set()
+                    break
         
         return images
     
+    def _motion_thumbnail(self, image):
+        """32x32 grayscale thumbnail of a JPEG for cheap frame-difference checks"""
+        gray = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        return cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+    
+    def _capture_one(self, camera_url, i, num_images, delay, stop):
+        """Fetch one snapshot after delay seconds unless stop is set; returns JPEG bytes or None"""
+        if stop.wait(delay):
+            return None
+        try:
+            response = self.session.get(camera_url, timeout=5)
+            if response.status_code == 200:
+                print(f"📸 Captured image {i+1}/{num_images}")
+                return response.content
+            else:
+                print(f"❌ Failed to capture image {i+1}")
+                
+        except Exception as e:
+            print(f"❌ Error capturing image {i+1}: {e}")
+        
+        return None
+    
     def draw_detections(self, frame, detections):
         """Draw hand landmarks and bounding boxes on frame for visualization"""
         for detection in detections:
@@ -2,15 +2,17 @@
 Database migration script
 
 This script creates the new database schema with proper session and incident tracking.
-Run this to initialize or upgrade the database.
+Run this to initialize or upgrade the database; pass --reset to wipe it first.
 """
 
 from flask import Flask
-from models import db, Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert
+from sqlalchemy import inspect
+from models import db, Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert, upgrade_schema
 import os
+import argparse
 
-def migrate_database():
-    """Create or migrate database to new schema"""
+def migrate_database(reset=False):
+    """Create or migrate database to new schema (reset=True drops all existing data first)"""
     
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///security_monitor.db'
@@ -32,19 +34,28 @@ def migrate_database():
                 print("   Migration cancelled.")
                 return
         
-        # Drop all tables (clean slate)
-        print("   Dropping existing tables...")
-        db.drop_all()
+        # WAL is persistent in the database file, so set it up front (set_sqlite_pragmas
+        # in models.py also applies the per-connection pragmas to every new connection)
+        with db.engine.connect() as conn:
+            journal_mode = conn.exec_driver_sql("PRAGMA journal_mode=WAL").scalar()
+        print(f"   Journal mode: {journal_mode}")
         
-        # Create all tables
+        # Only wipe existing data when explicitly asked to
+        if reset:
+            print("   Dropping existing tables...")
+            db.drop_all()
+        
+        # Create missing tables, columns and indexes; existing tables and rows are left alone
         print("   Creating new tables...")
         db.create_all()
+        upgrade_schema()
         
-        # Verify tables were created
+        # Verify tables were created (one catalog lookup instead of a COUNT per table)
         tables = [Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert]
+        existing = set(inspect(db.engine).get_table_names())
         for table in tables:
-            count = db.session.query(table).count()
-            print(f"   ✅ {table.__tablename__}: {count} rows")
+            status = "✅" if table.__tablename__ in existing else "❌"
+            print(f"   {status} {table.__tablename__}")
         
         print("✅ Database migration complete!")
         print(f"   Database file: security_monitor.db")
@@ -60,5 +71,9 @@ def migrate_database():
 
 
 if __name__ == '__main__':
-    migrate_database()
+    parser = argparse.ArgumentParser(description="Create missing tables and indexes in security_monitor.db")
+    parser.add_argument('--reset', action='store_true',
+                        help="drop every table first (deletes all sessions, incidents and frames)")
+    args = parser.parse_args()
+    migrate_database(reset=args.reset)
 
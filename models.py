@@ -10,13 +10,39 @@ Incident Management:
 - Each incident continues as long as hands remain in consecutive frames
 - Incidents track individual frames with hand detection data
 - After 10 frames, incidents are escalated with Gemini analysis
+
+Serialization:
+- to_dict() leaves datetimes as objects; the app's orjson JSON provider
+  writes them as ISO 8601 strings in C
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
 from datetime import datetime
-import json
+import base64
+import msgpack
+import orjson
+import sqlite3
+from frame_store import save_frame, frame_url
+
+# Committed objects keep their loaded values; every request and worker step uses its own
+# short-lived app context, so the refresh SELECTs after each commit bought nothing
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
-db = SQLAlchemy()
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enable WAL and a larger page cache on every new SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # Readers no longer block on the detection thread's writes
+    cursor.execute("PRAGMA synchronous=NORMAL")  # fsync at checkpoints instead of every commit
+    cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=134217728")  # 128 MB memory-mapped reads
+    cursor.close()
 
 
 class Session(db.Model):
@@ -24,7 +50,7 @@ class Session(db.Model):
     __tablename__ = 'sessions'
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     ended_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
@@ -33,26 +59,27 @@ class Session(db.Model):
     total_incidents = db.Column(db.Integer, default=0)
     total_escalations = db.Column(db.Integer, default=0)
     
-    # Relationships
-    incidents = db.relationship('Incident', backref='session', lazy=True, cascade='all, delete-orphan')
+    # Set when any incident is confirmed as a threat, so listing sessions never loads incidents
+    has_threat = db.Column(db.Boolean, default=False, server_default='0', nullable=False, index=True)
+    last_threat_at = db.Column(db.DateTime, nullable=True, index=True)  # Newest threat verdict (see after_insert hook)
     
-    def to_dict(self):
-        # Check if any incidents have threats detected
-        has_threat = any(incident.threat_detected for incident in self.incidents)
-        
+    # Relationships (collections raise instead of lazy loading; routes opt in with selectinload)
+    incidents = db.relationship('Incident', backref='session', lazy='raise_on_sql', cascade='all, delete-orphan')
+    
+    def to_dict(self, now=None):
+        """Serialize; pass `now` to share one clock reading across many rows"""
         return {
             'id': self.id,
-            'started_at': self.started_at.isoformat() if self.started_at else None,
-            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
             'is_active': self.is_active,
             'total_frames': self.total_frames,
             'total_incidents': self.total_incidents,
             'total_escalations': self.total_escalations,
-            'has_threat': has_threat,  # True if any incident detected a threat
+            'has_threat': self.has_threat,  # True if any incident detected a threat
+            'last_threat_at': self.last_threat_at,
             'duration_seconds': (
-                (self.ended_at - self.started_at).total_seconds() 
-                if self.ended_at else 
-                (datetime.utcnow() - self.started_at).total_seconds()
+                ((self.ended_at or now or datetime.utcnow()) - self.started_at).total_seconds()
             ) if self.started_at else 0
         }
 
@@ -60,12 +87,19 @@ class Session(db.Model):
 class Incident(db.Model):
     """Hand detection incident - created when hand first appears"""
     __tablename__ = 'incidents'
+    __table_args__ = (
+        # Threats page: filter on threat_detected, newest first
+        db.Index('ix_incidents_threat_started', 'threat_detected', 'started_at'),
+        # Active incident lookups per session
+        db.Index('ix_incident_session_active', 'session_id', 'is_active'),
+        db.Index('ix_incident_escalated', 'is_escalated'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     session_id = db.Column(db.Integer, db.ForeignKey('sessions.id'), nullable=False)
     
     # Timing
-    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     ended_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
@@ -83,20 +117,22 @@ class Incident(db.Model):
     threat_detected = db.Column(db.Boolean, default=False)
     threat_confidence = db.Column(db.Float, nullable=True)
     threat_explanation = db.Column(db.Text, nullable=True)
+    latest_gemini_analysis_id = db.Column(db.Integer, nullable=True)  # Kept by the GeminiAnalysis after_insert hook
     
     # Alert tracking
     user_alerted = db.Column(db.Boolean, default=False)
     alert_sent_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
-    frames = db.relationship('IncidentFrame', backref='incident', lazy=True, cascade='all, delete-orphan')
+    frames = db.relationship('IncidentFrame', backref='incident', lazy='raise_on_sql', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, now=None):
+        """Serialize; pass `now` to share one clock reading across many rows"""
         return {
             'id': self.id,
             'session_id': self.session_id,
-            'started_at': self.started_at.isoformat() if self.started_at else None,
-            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
             'is_active': self.is_active,
             'total_frames': self.total_frames,
             'max_hand_count': self.max_hand_count,
@@ -106,12 +142,11 @@ class Incident(db.Model):
             'threat_detected': self.threat_detected,
             'threat_confidence': self.threat_confidence,
             'threat_explanation': self.threat_explanation,
+            'latest_gemini_analysis_id': self.latest_gemini_analysis_id,
             'user_alerted': self.user_alerted,
-            'alert_sent_at': self.alert_sent_at.isoformat() if self.alert_sent_at else None,
+            'alert_sent_at': self.alert_sent_at,
             'duration_seconds': (
-                (self.ended_at - self.started_at).total_seconds() 
-                if self.ended_at else 
-                (datetime.utcnow() - self.started_at).total_seconds()
+                ((self.ended_at or now or datetime.utcnow()) - self.started_at).total_seconds()
             ) if self.started_at else 0
         }
 
@@ -119,6 +154,10 @@ class Incident(db.Model):
 class IncidentFrame(db.Model):
     """Individual frame data within an incident"""
     __tablename__ = 'incident_frames'
+    __table_args__ = (
+        # Frames of an incident in order (escalation batches, detail view)
+        db.Index('ix_frame_incident_framenum', 'incident_id', 'frame_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     incident_id = db.Column(db.Integer, db.ForeignKey('incidents.id'), nullable=False)
@@ -133,29 +172,35 @@ class IncidentFrame(db.Model):
     hand_count = db.Column(db.Integer, default=0)
     hand_confidence = db.Column(db.Float, default=0.0)
     
-    # Hand data (stored as JSON)
+    # Hand data (stored as MessagePack)
     # Format: [{'type': 'left_hand'/'right_hand', 'confidence': 0.95, 'bbox': [x1,y1,x2,y2], 'landmarks': [...]}]
-    hand_data = db.Column(db.Text, nullable=True)  # JSON string
+    hand_data_bin = db.Column(db.LargeBinary, nullable=True)  # msgpack blob
     
-    # Image data (base64 encoded JPEG)
-    image_data = db.Column(db.Text, nullable=True)  # Base64 string (optional, can be heavy)
+    # Image (raw JPEG in the frame store, see frame_store.py)
+    image_sha256 = db.Column(db.String(64), nullable=True, index=True)  # Optional, only every few frames
     
-    def to_dict(self):
+    def to_summary_dict(self):
+        """Frame fields the dashboard lists need (hand data is not decoded)"""
         return {
             'id': self.id,
             'incident_id': self.incident_id,
             'frame_number': self.frame_number,
             'global_frame_number': self.global_frame_number,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'timestamp': self.timestamp,
             'hands_detected': self.hands_detected,
             'hand_count': self.hand_count,
             'hand_confidence': self.hand_confidence,
-            'hand_data': json.loads(self.hand_data) if self.hand_data else [],
-            'frame_image': self.image_data  # Include base64 image data for display
+            'frame_url': frame_url(self.image_sha256)  # Served by /api/frames/<sha>.jpg
         }
     
-    def set_hand_data(self, hand_list):
-        """Store hand detection data as JSON"""
+    def to_dict(self):
+        data = self.to_summary_dict()
+        data['hand_data'] = self.get_hand_data()
+        return data
+    
+    @staticmethod
+    def pack_hand_data(hand_list):
+        """Encode hand detection data as a MessagePack blob"""
         # Convert landmarks to serializable format (remove MediaPipe objects)
         serializable_hands = []
         for hand in hand_list:
@@ -168,13 +213,23 @@ class IncidentFrame(db.Model):
             }
             serializable_hands.append(serializable_hand)
         
-        self.hand_data = json.dumps(serializable_hands)
+        return msgpack.packb(serializable_hands, use_bin_type=True)
+    
+    def set_hand_data(self, hand_list):
+        """Store hand detection data as MessagePack"""
+        self.hand_data_bin = self.pack_hand_data(hand_list)
     
     def get_hand_data(self):
-        """Retrieve hand detection data from JSON"""
-        if self.hand_data:
-            return json.loads(self.hand_data)
-        return []
+        """Retrieve hand detection data from MessagePack (decoded once per raw value)"""
+        if not self.hand_data_bin:
+            return []
+        
+        # Cache lives in __dict__ so it stays outside SQLAlchemy's attribute tracking
+        cached = self.__dict__.get('_hand_data_cache')
+        if cached is None or cached[0] is not self.hand_data_bin:
+            cached = (self.hand_data_bin, msgpack.unpackb(self.hand_data_bin, raw=False))
+            self.__dict__['_hand_data_cache'] = cached
+        return cached[1]
 
 
 class GeminiAnalysis(db.Model):
@@ -203,13 +258,13 @@ class GeminiAnalysis(db.Model):
     tokens_used = db.Column(db.Integer, nullable=True)
     
     # Relationship
-    incident = db.relationship('Incident', backref='gemini_analyses', lazy=True)
+    incident = db.relationship('Incident', backref=db.backref('gemini_analyses', lazy='raise_on_sql'), lazy=True)
     
     def to_dict(self):
         return {
             'id': self.id,
             'incident_id': self.incident_id,
-            'analyzed_at': self.analyzed_at.isoformat() if self.analyzed_at else None,
+            'analyzed_at': self.analyzed_at,
             'frame_start': self.frame_start,
             'frame_end': self.frame_end,
             'total_frames_analyzed': self.total_frames_analyzed,
@@ -243,18 +298,147 @@ class UserAlert(db.Model):
     acknowledged_at = db.Column(db.DateTime, nullable=True)
     
     # Relationship
-    incident = db.relationship('Incident', backref='alerts', lazy=True)
+    incident = db.relationship('Incident', backref=db.backref('alerts', lazy='raise_on_sql'), lazy=True)
     
     def to_dict(self):
         return {
             'id': self.id,
             'incident_id': self.incident_id,
             'alert_type': self.alert_type,
-            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'sent_at': self.sent_at,
             'audio_played': self.audio_played,
             'notification_sent': self.notification_sent,
             'message': self.message,
             'acknowledged': self.acknowledged,
-            'acknowledged_at': self.acknowledged_at.isoformat() if self.acknowledged_at else None
+            'acknowledged_at': self.acknowledged_at
         }
 
+
+@event.listens_for(GeminiAnalysis, 'after_insert')
+def denormalize_analysis(mapper, connection, analysis):
+    """Copy a new analysis onto its incident (and session, for threats) so reads skip the join"""
+    connection.execute(
+        db.update(Incident).where(Incident.id == analysis.incident_id)
+        .values(latest_gemini_analysis_id=analysis.id)
+    )
+    if analysis.threat_detected:
+        session_id = db.select(Incident.session_id).where(Incident.id == analysis.incident_id).scalar_subquery()
+        connection.execute(
+            db.update(Session).where(Session.id == session_id)
+            .values(last_threat_at=analysis.analyzed_at)
+        )
+
+
+def ensure_indexes():
+    """Create any model indexes missing from an existing database (create_all skips existing tables)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def ensure_columns():
+    """Add model columns missing from existing tables (create_all never alters a table); returns 'table.column' names added"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+                # SQLite only accepts a NOT NULL column when existing rows get a default
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {getattr(column.server_default.arg, 'text', column.server_default.arg)}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.exec_driver_sql(ddl)
+                added.append(f"{table.name}.{column.name}")
+    
+    return added
+
+
+def upgrade_schema():
+    """Bring an existing database up to the current models: new columns, backfills, then indexes"""
+    added = ensure_columns()
+    for name in added:
+        print(f"🧱 Added column {name}")
+    
+    if 'sessions.has_threat' in added:
+        threat_sessions = db.select(Incident.session_id).where(Incident.threat_detected == True)
+        db.session.execute(
+            db.update(Session).where(Session.id.in_(threat_sessions)).values(has_threat=True)
+        )
+        db.session.commit()
+    
+    if 'incidents.latest_gemini_analysis_id' in added:
+        db.session.execute(db.update(Incident).values(
+            latest_gemini_analysis_id=db.select(db.func.max(GeminiAnalysis.id))
+            .where(GeminiAnalysis.incident_id == Incident.id).scalar_subquery()
+        ))
+        db.session.commit()
+    
+    if 'sessions.last_threat_at' in added:
+        db.session.execute(db.update(Session).values(
+            last_threat_at=db.select(db.func.max(GeminiAnalysis.analyzed_at))
+            .join(Incident, GeminiAnalysis.incident_id == Incident.id)
+            .where(Incident.session_id == Session.id, GeminiAnalysis.threat_detected == True)
+            .scalar_subquery()
+        ))
+        db.session.commit()
+    
+    # Run while legacy rows remain (not just when the column is new) so an interrupted conversion resumes
+    convert_legacy_hand_data()
+    convert_legacy_images()
+    
+    ensure_indexes()
+
+
+def convert_legacy_hand_data():
+    """Copy any remaining rows of the old JSON hand_data column into hand_data_bin"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('incident_frames')}
+    if 'hand_data' not in columns:
+        return
+    
+    with db.engine.begin() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT id, hand_data FROM incident_frames WHERE hand_data IS NOT NULL"
+        ).fetchall()
+        if not rows:
+            return
+        conn.exec_driver_sql(
+            "UPDATE incident_frames SET hand_data_bin = ?, hand_data = NULL WHERE id = ?",
+            [(msgpack.packb(orjson.loads(hand_data), use_bin_type=True), frame_id) for frame_id, hand_data in rows]
+        )
+    print(f"🧱 Converted hand data of {len(rows)} frames to MessagePack")
+
+
+def convert_legacy_images(batch_size=100):
+    """Move any remaining rows of the old base64 image_data column into the frame store"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('incident_frames')}
+    if 'image_data' not in columns:
+        return
+    
+    converted = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT id, image_data FROM incident_frames"
+                " WHERE image_data IS NOT NULL AND image_sha256 IS NULL LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.exec_driver_sql(
+                "UPDATE incident_frames SET image_sha256 = ?, image_data = NULL WHERE id = ?",
+                [(save_frame(base64.b64decode(image_data)), frame_id) for frame_id, image_data in rows]
+            )
+        converted += len(rows)
+    
+    if converted:
+        print(f"🧱 Moved {converted} frame images to the frame store")
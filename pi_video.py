@@ -4,25 +4,55 @@ Run this on the Raspberry Pi to stream the camera feed.
 
 from flask import Flask, Response
 from picamera2 import Picamera2
-import io
-import time
+import cv2
+import numpy as np
 import atexit
 import signal
 import sys
+import os
+import glob
 import threading
-import random
 from sense_hat import SenseHat
 
+# PyTurboJPEG (optional) encodes straight from the capture array with libjpeg-turbo's SIMD paths
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError):
+    turbo_jpeg = None
+
 app = Flask(__name__)
 
+# JPEG quality for the MJPEG stream (PyTurboJPEG if installed, else OpenCV)
+JPEG_QUALITY = 75
+
+# MJPEG multipart framing, built once instead of per yielded frame
+FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+FRAME_TRAILER = b'\r\n'
+
+# Name the Sense HAT driver registers its 8x8 RGB565 LED framebuffer under
+SENSE_FB_NAME = 'RPi-Sense FB'
+
 # Initialize camera with proper cleanup
 picam2 = None
 sense = None
+led_fb = None  # File descriptor of the Sense HAT LED framebuffer
 led_thread = None
+capture_thread = None
+
+# Set on shutdown; LED patterns and workers wait on it instead of sleeping
+stop_event = threading.Event()
+
+# Latest MJPEG part (JPEG already wrapped in framing), shared by every /video_feed client
+# ('seq' counts published frames so each client sends every frame at most once)
+latest_frame = {'bytes': b'', 'seq': 0, 'cv': threading.Condition()}
 
 def cleanup_camera():
     """Properly close camera and Sense HAT on shutdown"""
-    global picam2, sense, led_thread
+    global picam2, sense, led_thread, led_fb
+    # Wake every worker out of its wait so shutdown doesn't stall
+    stop_event.set()
+    
     if picam2 is not None:
         try:
             picam2.stop()
@@ -31,6 +61,14 @@ def cleanup_camera():
         except Exception as e:
             print(f"Error closing camera: {e}")
     
+    # Stop the LED thread first so it can't draw over the cleared matrix
+    if led_thread is not None:
+        try:
+            led_thread.join(timeout=1)
+            print("LED thread stopped")
+        except Exception as e:
+            print(f"Error stopping LED thread: {e}")
+    
     if sense is not None:
         try:
             sense.clear()
@@ -38,20 +76,20 @@ def cleanup_camera():
         except Exception as e:
             print(f"Error clearing Sense HAT: {e}")
     
-    if led_thread is not None:
+    if led_fb is not None:
         try:
-            led_thread.join(timeout=1)
-            print("LED thread stopped")
-        except Exception as e:
-            print(f"Error stopping LED thread: {e}")
+            os.close(led_fb)
+        except OSError:
+            pass
+        led_fb = None
 
 def init_camera():
     """Initialize camera with error handling"""
     global picam2
     try:
         picam2 = Picamera2()
-        # Use default configuration for best color accuracy
-        config = picam2.create_preview_configuration()
+        # RGB888 frames are laid out as BGR in memory, which is what OpenCV expects
+        config = picam2.create_preview_configuration(main={"format": "RGB888"})
         picam2.configure(config)
         picam2.start()
         print("Camera initialized successfully")
@@ -61,127 +99,139 @@ def init_camera():
 
 def init_sense_hat():
     """Initialize Sense HAT for LED patterns"""
-    global sense
+    global sense, led_fb
     try:
         sense = SenseHat()
         sense.clear()
         print("Sense HAT initialized")
+        
+        # Write LED frames straight to the framebuffer when we can open it
+        fb_path = find_led_framebuffer()
+        if fb_path:
+            try:
+                led_fb = os.open(fb_path, os.O_WRONLY)
+                print(f"Sense HAT framebuffer: {fb_path}")
+            except OSError as e:
+                print(f"Framebuffer unavailable, using set_pixels: {e}")
         return True
     except Exception as e:
         print(f"Error initializing Sense HAT: {e}")
         return False
 
-def hsv_to_rgb(h, s, v):
-    """Convert HSV to RGB (h: 0-360, s: 0-1, v: 0-1)"""
-    import math
-    h = h % 360  # Ensure h is in range
-    h = h / 60.0  # Convert to 0-6 range
-    i = int(h)
-    f = h - i
-    p = v * (1.0 - s)
-    q = v * (1.0 - s * f)
-    t = v * (1.0 - s * (1.0 - f))
-    
-    i = i % 6  # Ensure i is 0-5
-    
-    if i == 0:
-        return (int(v * 255), int(t * 255), int(p * 255))
-    elif i == 1:
-        return (int(q * 255), int(v * 255), int(p * 255))
-    elif i == 2:
-        return (int(p * 255), int(v * 255), int(t * 255))
-    elif i == 3:
-        return (int(p * 255), int(q * 255), int(v * 255))
-    elif i == 4:
-        return (int(t * 255), int(p * 255), int(v * 255))
+# Row/column index grids for building whole 8x8 LED frames at once
+LED_Y, LED_X = np.mgrid[0:8, 0:8]
+
+def find_led_framebuffer():
+    """Path of the Sense HAT LED framebuffer device, or None"""
+    for name_file in sorted(glob.glob('/sys/class/graphics/fb*/name')):
+        try:
+            with open(name_file) as f:
+                if f.read().strip() == SENSE_FB_NAME:
+                    return os.path.join('/dev', os.path.basename(os.path.dirname(name_file)))
+        except OSError:
+            continue
+    return None
+
+def pack_rgb565(frame):
+    """Pack an (8, 8, 3) uint8 frame into the framebuffer's little-endian RGB565 layout"""
+    rgb = frame.astype(np.uint16)
+    packed = ((rgb[..., 0] >> 3) << 11) | ((rgb[..., 1] >> 2) << 5) | (rgb[..., 2] >> 3)
+    return packed.astype('<u2').tobytes()
+
+def show_frame(frame):
+    """Push an (8, 8, 3) uint8 frame to the Sense HAT in one call"""
+    if led_fb is not None:
+        # One write of the packed frame, skipping set_pixels' per-pixel validation
+        os.pwrite(led_fb, pack_rgb565(frame), 0)
     else:
-        return (int(v * 255), int(p * 255), int(q * 255))
+        sense.set_pixels(frame.reshape(64, 3).tolist())
+
+# Per-degree HSV -> RGB chroma weights (R, G, B), so a conversion is a table lookup
+# plus one multiply: rgb = v * (1 - s * HUE_LUT[hue])
+_HUE_K = (np.array([5, 3, 1]) + np.arange(360)[:, None] / 60.0) % 6
+HUE_LUT = np.clip(np.minimum(_HUE_K, 4 - _HUE_K), 0, 1)
+
+def hsv_to_rgb(h, s, v):
+    """Convert HSV to RGB (h: 0-360, s: 0-1, v: 0-1); works on whole arrays, returns uint8 (..., 3)"""
+    hue = np.asarray(h).astype(np.int64) % 360
+    v = np.asarray(v, dtype=np.float64)[..., None]
+    return (v * (1 - s * HUE_LUT[hue]) * 255).astype(np.uint8)
+
+def render_rainbow(offset):
+    """Render one rainbow wave frame at the given phase offset"""
+    wave = np.sin((LED_X + LED_Y) / 3.0 + offset) * 0.5 + 0.5
+    hue = (offset * 50 + LED_X * 20 + LED_Y * 20) % 360
+    return hsv_to_rgb(hue, 0.8, wave * 0.6 + 0.2)
+
+def play_frames(frames):
+    """Play a precomputed sequence of frames at 50ms per frame"""
+    for frame in frames:
+        show_frame(frame)
+        if stop_event.wait(0.05):
+            return
 
 def rainbow_wave():
     """Create a rainbow wave pattern"""
-    import math
-    offset = 0
-    for _ in range(160):  # Run for about 8 seconds at 50ms per frame
-        pixels = []
-        for y in range(8):
-            for x in range(8):
-                # Create wave effect
-                wave = math.sin((x + y) / 3.0 + offset) * 0.5 + 0.5
-                hue = (offset * 50 + x * 20 + y * 20) % 360
-                r, g, b = hsv_to_rgb(hue, 0.8, wave * 0.6 + 0.2)
-                pixels.append((r, g, b))
-        
-        sense.set_pixels(pixels)
-        offset += 0.1
-        time.sleep(0.05)
+    play_frames(RAINBOW_FRAMES)
+
+# Fire color ramp: green starts 100 and blue 200 intensity steps after red
+FIRE_CHANNEL_OFFSETS = np.array([0, 100, 200], dtype=np.int16)
 
 def fire_pattern():
     """Create a fire-like pattern"""
     for _ in range(160):  # Run for about 8 seconds
-        pixels = []
-        for y in range(8):
-            for x in range(8):
-                # Fire effect - hotter at bottom, cooler at top
-                base_intensity = random.randint(100, 255) * (8 - y) / 8
-                r = int(min(255, base_intensity))
-                g = int(max(0, base_intensity - 100))
-                b = int(max(0, base_intensity - 200))
-                pixels.append((r, g, b))
+        # Fire effect - hotter at bottom, cooler at top
+        base_intensity = np.random.randint(100, 256, (8, 8), dtype=np.int16) * (8 - LED_Y) // 8
+        frame = np.clip(base_intensity[..., None] - FIRE_CHANNEL_OFFSETS, 0, 255).astype(np.uint8)
         
-        sense.set_pixels(pixels)
-        time.sleep(0.05)
+        show_frame(frame)
+        if stop_event.wait(0.05):
+            return
+
+# Green intensity of a raindrop's head and its three-pixel trail
+RAIN_TRAIL = (255 * (1 - np.arange(4) * 0.3)).astype(np.uint8)
 
 def matrix_rain():
     """Create a Matrix-style rain effect"""
-    import math
-    rain_cols = [random.randint(0, 7) for _ in range(8)]
-    rain_pos = [random.randint(0, 7) for _ in range(8)]
+    rain_cols = np.random.randint(0, 8, 8)
+    rain_pos = np.random.randint(0, 8, 8)
     
     for _ in range(160):  # Run for about 8 seconds
-        pixels = [(0, 0, 0)] * 64
+        frame = np.zeros((8, 8, 3), dtype=np.uint8)
         
-        for col_idx, col in enumerate(rain_cols):
-            pos = rain_pos[col_idx]
-            # Draw falling character with trail
-            for trail in range(4):
-                y = (pos - trail) % 8
-                intensity = int(255 * (1 - trail * 0.3))
-                pixels[y * 8 + col] = (0, intensity, 0)
-            
-            # Move rain down
-            rain_pos[col_idx] = (rain_pos[col_idx] + 1) % 12
-            
-            # Occasionally start new rain column
-            if random.random() < 0.05:
-                rain_cols[col_idx] = random.randint(0, 7)
+        # Draw every falling character with its trail in one indexed write
+        trail_rows = (rain_pos[:, None] - np.arange(4)) % 8
+        frame[trail_rows, rain_cols[:, None], 1] = RAIN_TRAIL
+        
+        # Move rain down
+        rain_pos = (rain_pos + 1) % 12
         
-        sense.set_pixels(pixels)
-        time.sleep(0.05)
+        # Occasionally start new rain column
+        restart = np.random.random(8) < 0.05
+        rain_cols[restart] = np.random.randint(0, 8, restart.sum())
+        
+        show_frame(frame)
+        if stop_event.wait(0.05):
+            return
+
+def render_spiral(offset):
+    """Render one spiral frame at the given phase offset"""
+    hue = (SPIRAL_ANGLE * 57.3 + SPIRAL_DIST * 40 + offset * 50) % 360
+    brightness = 0.4 + 0.2 * np.sin(SPIRAL_DIST - offset)
+    return hsv_to_rgb(hue, 0.9, brightness)
 
 def spiral_pattern():
     """Create a colorful spiral pattern"""
-    import math
-    offset = 0
-    
-    for _ in range(160):  # Run for about 8 seconds
-        pixels = []
-        for y in range(8):
-            for x in range(8):
-                # Calculate angle and distance from center
-                dx = x - 3.5
-                dy = y - 3.5
-                angle = math.atan2(dy, dx)
-                dist = math.sqrt(dx * dx + dy * dy)
-                
-                # Create spiral effect
-                hue = ((angle * 57.3 + dist * 40 + offset * 50) % 360)
-                brightness = 0.4 + 0.2 * math.sin(dist - offset)
-                r, g, b = hsv_to_rgb(hue, 0.9, brightness)
-                pixels.append((r, g, b))
-        
-        sense.set_pixels(pixels)
-        offset += 0.06
-        time.sleep(0.05)
+    play_frames(SPIRAL_FRAMES)
+
+# Angle and distance of each LED from the center of the matrix
+SPIRAL_ANGLE = np.arctan2(LED_Y - 3.5, LED_X - 3.5)
+SPIRAL_DIST = np.hypot(LED_X - 3.5, LED_Y - 3.5)
+
+# Rainbow and spiral are deterministic, so render their ~8 second runs
+# (160 frames each) once at startup
+RAINBOW_FRAMES = [render_rainbow(i * 0.1) for i in range(160)]
+SPIRAL_FRAMES = [render_spiral(i * 0.06) for i in range(160)]
 
 def led_animation_worker():
     """LED animation worker thread"""
@@ -193,7 +243,7 @@ def led_animation_worker():
     pattern_names = ["Rainbow Wave", "Fire", "Matrix Rain", "Spiral"]
     pattern_index = 0
     
-    while True:
+    while not stop_event.is_set():
         try:
             pattern = patterns[pattern_index]
             pattern_name = pattern_names[pattern_index]
@@ -207,12 +257,39 @@ def led_animation_worker():
             pattern_index = (pattern_index + 1) % len(patterns)
             
             # Small pause between patterns
-            time.sleep(0.2)
+            stop_event.wait(0.2)
             
         except Exception as e:
             print(f"Error in LED animation: {e}")
             sense.clear()
-            time.sleep(1)
+            stop_event.wait(1)
+
+def encode_jpeg(frame):
+    """Encode a BGR capture array as a JPEG bytes-like object (None on failure)"""
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=JPEG_QUALITY, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer if ok else None
+
+def capture_worker():
+    """Single producer: capture and encode each frame once for all clients"""
+    while not stop_event.is_set():
+        try:
+            # Grab the raw frame and encode it directly (no BytesIO round-trip)
+            frame = picam2.capture_array()
+            jpeg = encode_jpeg(frame)
+            if jpeg is None:
+                continue
+            
+            # Frame once here so clients yield the shared part without copying
+            part = b''.join((FRAME_HEADER, jpeg, FRAME_TRAILER))
+            with latest_frame['cv']:
+                latest_frame['bytes'] = part
+                latest_frame['seq'] += 1
+                latest_frame['cv'].notify_all()
+        except Exception as e:
+            print(f"Error capturing frame: {e}")
+            stop_event.wait(0.1)
 
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully"""
@@ -225,8 +302,10 @@ atexit.register(cleanup_camera)
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
-# Initialize camera
+# Initialize camera and start the shared capture thread
 init_camera()
+capture_thread = threading.Thread(target=capture_worker, daemon=True)
+capture_thread.start()
 
 # Initialize Sense HAT and start LED animations
 if init_sense_hat():
@@ -237,14 +316,15 @@ else:
     print("⚠️  Sense HAT not available - LED animations disabled")
 
 def generate():
+    last_seq = 0
     while True:
-        # Use Picamera2's built-in JPEG encoder for proper color handling
-        stream = io.BytesIO()
-        picam2.capture_file(stream, format='jpeg')
-        stream.seek(0)
-        frame_data = stream.read()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
+        # Wait for the capture thread to publish a frame this client hasn't sent yet
+        with latest_frame['cv']:
+            if not latest_frame['cv'].wait_for(lambda: latest_frame['seq'] != last_seq, timeout=5):
+                continue
+            last_seq = latest_frame['seq']
+            part = latest_frame['bytes']
+        yield part
 
 @app.route('/video_feed')
 def video_feed():
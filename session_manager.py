@@ -11,11 +11,25 @@ This module handles the business logic for:
 """
 
 from models import db, Session, Incident, IncidentFrame, GeminiAnalysis, UserAlert
+from sqlalchemy.orm import load_only
+from frame_store import save_frame
 from datetime import datetime
-import base64
+import threading
 import cv2
 import numpy as np
 
+# Incident frames are inserted in batches of this many rows
+FRAME_FLUSH_SIZE = 10
+
+# JPEG quality for stored incident frames; the stored bytes are exactly what both the
+# dashboard and Gemini receive, so this trades file size against detail for both
+FRAME_JPEG_QUALITY = 70
+
+# Incident frames whose 64-bit average hash is within this many bits of the last stored
+# image are kept as metadata only (never more than MAX_SKIPPED_IMAGES in a row)
+DUPLICATE_HASH_DISTANCE = 5
+MAX_SKIPPED_IMAGES = 2
+
 
 class SessionManager:
     """Manages monitoring sessions"""
@@ -37,28 +51,47 @@ class SessionManager:
         return session
     
     @staticmethod
-    def end_session(session_id):
-        """End an active monitoring session"""
-        session = Session.query.get(session_id)
+    def end_session(session_id, total_frames=None):
+        """End an active monitoring session (optionally recording its final frame count)"""
+        session = db.session.get(Session, session_id)
         if not session:
             raise ValueError(f"Session #{session_id} not found")
         
         if not session.is_active:
             raise ValueError(f"Session #{session_id} is already ended")
         
-        # Close any active incidents
+        if total_frames is not None:
+            session.total_frames = total_frames
+        
+        # Close any active incidents and the session in a single transaction
+        ended_at = datetime.utcnow()
         active_incidents = Incident.query.filter_by(
             session_id=session_id,
             is_active=True
         ).all()
         
-        for incident in active_incidents:
-            IncidentManager.end_incident(incident.id)
+        flushed = {}
+        try:
+            for incident in active_incidents:
+                flushed[incident.id] = IncidentManager._write_pending_frames(incident)
+                incident.ended_at = ended_at
+                incident.is_active = False
+        except Exception:
+            for incident_id, rows in flushed.items():
+                IncidentManager._restore_pending_frames(incident_id, rows)
+            raise
         
         # End session
-        session.ended_at = datetime.utcnow()
+        session.ended_at = ended_at
         session.is_active = False
-        db.session.commit()
+        IncidentManager._commit_frames(flushed)
+        with IncidentManager._pending_lock:
+            for incident in active_incidents:
+                IncidentManager._frame_state.pop(incident.id, None)
+        
+        for incident in active_incidents:
+            duration = (incident.ended_at - incident.started_at).total_seconds()
+            print(f"✅ Incident #{incident.id} ended after {incident.total_frames} frames ({duration:.1f}s)")
         
         print(f"🛑 Session #{session_id} ended at {session.ended_at}")
         print(f"   Duration: {(session.ended_at - session.started_at).total_seconds():.1f}s")
@@ -76,17 +109,34 @@ class SessionManager:
     @staticmethod
     def increment_frame_count(session_id):
         """Increment the frame count for a session"""
-        session = Session.query.get(session_id)
-        if session:
-            session.total_frames += 1
-            db.session.commit()
-            return session.total_frames
-        return 0
+        db.session.execute(
+            db.update(Session).where(Session.id == session_id)
+            .values(total_frames=Session.total_frames + 1)
+        )
+        db.session.commit()
+        total_frames = db.session.scalar(db.select(Session.total_frames).where(Session.id == session_id))
+        return total_frames or 0
+    
+    @staticmethod
+    def set_frame_count(session_id, total_frames):
+        """Write a session's running frame count in one UPDATE, without loading the row"""
+        db.session.execute(
+            db.update(Session).where(Session.id == session_id).values(total_frames=total_frames)
+        )
+        db.session.commit()
 
 
 class IncidentManager:
     """Manages hand detection incidents"""
     
+    # Frame rows waiting to be written, per incident
+    _pending_frames = {}
+    # Per-incident frame numbering, escalation and duplicate-image state, so frames that aren't
+    # flushed don't have to load the incident
+    # ({'written', 'flushing', 'escalated', 'threshold', 'image_hash', 'skipped_images'})
+    _frame_state = {}
+    _pending_lock = threading.Lock()
+    
     @staticmethod
     def create_incident(session_id):
         """Create a new incident when hands are first detected"""
@@ -102,10 +152,8 @@ class IncidentManager:
         )
         db.session.add(incident)
         
-        # Update session incident count
-        session = Session.query.get(session_id)
-        if session:
-            session.total_incidents += 1
+        # Update session incident count (in SQL, without loading the session)
+        IncidentManager._increment_session_counter(session_id, Session.total_incidents)
         
         db.session.commit()
         
@@ -123,13 +171,16 @@ class IncidentManager:
     @staticmethod
     def end_incident(incident_id):
         """End an active incident (no hands detected in next frame)"""
-        incident = Incident.query.get(incident_id)
+        incident = db.session.get(Incident, incident_id)
         if not incident:
             return None
         
+        rows = IncidentManager._write_pending_frames(incident)
         incident.ended_at = datetime.utcnow()
         incident.is_active = False
-        db.session.commit()
+        IncidentManager._commit_frames({incident_id: rows})
+        with IncidentManager._pending_lock:
+            IncidentManager._frame_state.pop(incident_id, None)
         
         duration = (incident.ended_at - incident.started_at).total_seconds()
         print(f"✅ Incident #{incident_id} ended after {incident.total_frames} frames ({duration:.1f}s)")
@@ -141,80 +192,177 @@ class IncidentManager:
         """
         Add a frame to an incident
         
+        Frames are buffered and written together every FRAME_FLUSH_SIZE frames
+        (and when the incident ends), so frame numbers that are a multiple of
+        FRAME_FLUSH_SIZE are always in the database when this returns.
+        
         Args:
             incident_id: ID of the incident
             global_frame_num: Frame number in the entire session
             hand_count: Number of hands detected
             hand_confidence: Maximum confidence score
             hand_detections: List of hand detection dicts from MediaPipe
-            frame_image: Optional numpy array of the frame (will be converted to base64)
+            frame_image: Optional numpy array of the frame (stored as a JPEG in the frame store
+                unless it's a near-duplicate of the incident's last stored image)
         
         Returns:
-            IncidentFrame object
+            (frame_number, should_escalate)
         """
-        incident = Incident.query.get(incident_id)
-        if not incident:
-            raise ValueError(f"Incident #{incident_id} not found")
-        
-        # Increment incident frame count
-        incident.total_frames += 1
-        frame_number = incident.total_frames
-        
-        # Update incident max values
-        if hand_count > incident.max_hand_count:
-            incident.max_hand_count = hand_count
-        if hand_confidence > incident.max_confidence:
-            incident.max_confidence = hand_confidence
-        
-        # Convert frame image to base64 (optional, can be heavy)
+        with IncidentManager._pending_lock:
+            state = IncidentManager._frame_state.get(incident_id)
+        if state is None:
+            # First frame since the incident was created or the app started; load it once
+            incident = db.session.get(Incident, incident_id)
+            if not incident:
+                raise ValueError(f"Incident #{incident_id} not found")
+            with IncidentManager._pending_lock:
+                state = IncidentManager._frame_state.setdefault(incident_id, {
+                    'written': incident.total_frames,
+                    'flushing': 0,
+                    'escalated': incident.is_escalated,
+                    'threshold': incident.escalation_threshold,
+                    'image_hash': None,
+                    'skipped_images': 0
+                })
+        
+        # Write the frame JPEG to the frame store; the row only keeps its hash
         # Only encode if frame_image is provided (we skip every 4th frame to reduce lag)
-        image_data_b64 = None
+        # and it isn't a near-duplicate of the last stored image
+        image_sha256 = None
         if frame_image is not None:
-            _, buffer = cv2.imencode('.jpg', frame_image, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            image_data_b64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Create frame record
-        frame = IncidentFrame(
-            incident_id=incident_id,
-            frame_number=frame_number,
-            global_frame_number=global_frame_num,
-            timestamp=datetime.utcnow(),
-            hands_detected=hand_count > 0,
-            hand_count=hand_count,
-            hand_confidence=hand_confidence,
-            image_data=image_data_b64
-        )
-        
-        # Store hand detection data
-        frame.set_hand_data(hand_detections)
-        
-        db.session.add(frame)
-        db.session.commit()
-        
-        saved_status = "with image" if image_data_b64 else "metadata only"
-        print(f"   📸 Frame #{frame_number} added to Incident #{incident_id} (global #{global_frame_num}, {saved_status})")
+            image_hash = IncidentManager._average_hash(frame_image)
+            with IncidentManager._pending_lock:
+                last_hash = state['image_hash']
+                store_image = (last_hash is None or state['skipped_images'] >= MAX_SKIPPED_IMAGES
+                               or bin(image_hash ^ last_hash).count('1') >= DUPLICATE_HASH_DISTANCE)
+                if store_image:
+                    state['image_hash'] = image_hash
+                    state['skipped_images'] = 0
+                else:
+                    state['skipped_images'] += 1
+            if store_image:
+                _, buffer = cv2.imencode('.jpg', frame_image, [cv2.IMWRITE_JPEG_QUALITY, FRAME_JPEG_QUALITY])
+                image_sha256 = save_frame(buffer)  # The encoder's array is hashed and written as-is, no bytes copy
+        
+        with IncidentManager._pending_lock:
+            pending = IncidentManager._pending_frames.setdefault(incident_id, [])
+            frame_number = state['written'] + state['flushing'] + len(pending) + 1
+            pending.append({
+                'incident_id': incident_id,
+                'frame_number': frame_number,
+                'global_frame_number': global_frame_num,
+                'timestamp': datetime.utcnow(),
+                'hands_detected': hand_count > 0,
+                'hand_count': hand_count,
+                'hand_confidence': hand_confidence,
+                'hand_data_bin': IncidentFrame.pack_hand_data(hand_detections),
+                'image_sha256': image_sha256
+            })
+            reaches_threshold = not state['escalated'] and frame_number >= state['threshold']
+        
+        if frame_number % FRAME_FLUSH_SIZE != 0 and not reaches_threshold:
+            return frame_number, False
+        
+        incident = db.session.get(Incident, incident_id)
+        if not incident:
+            raise ValueError(f"Incident #{incident_id} not found")
+        rows = IncidentManager._write_pending_frames(incident)
         
         # Check if we should escalate
+        should_escalate = False
         if not incident.is_escalated and incident.total_frames >= incident.escalation_threshold:
             print(f"   ⚠️  Incident #{incident_id} reached {incident.total_frames} frames - ESCALATING!")
             incident.is_escalated = True
             
             # Update session escalation count
-            session = Session.query.get(incident.session_id)
-            if session:
-                session.total_escalations += 1
-            
-            db.session.commit()
-            
-            # Return True to signal escalation needed
-            return frame, True
+            IncidentManager._increment_session_counter(incident.session_id, Session.total_escalations)
+            should_escalate = True
+        escalated = incident.is_escalated
+        
+        IncidentManager._commit_frames({incident_id: rows})
+        with IncidentManager._pending_lock:
+            state['escalated'] = escalated
         
-        return frame, False
+        # Return True to signal escalation needed
+        return frame_number, should_escalate
+    
+    @staticmethod
+    def _average_hash(frame):
+        """64-bit average hash of a BGR frame (8x8 grayscale, one bit per pixel above the mean)"""
+        small = cv2.cvtColor(cv2.resize(frame, (8, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return int.from_bytes(np.packbits(small > small.mean()).tobytes(), 'big')
+    
+    @staticmethod
+    def _increment_session_counter(session_id, column):
+        """Add one to a Session counter column with an UPDATE (caller commits)"""
+        db.session.execute(
+            db.update(Session).where(Session.id == session_id).values({column: column + 1})
+        )
+    
+    @staticmethod
+    def _write_pending_frames(incident):
+        """
+        Insert an incident's buffered frames in one statement and fold them into its totals
+        
+        The caller commits with _commit_frames(), which counts the returned rows as
+        written (or puts them back in the buffer if the transaction fails).
+        """
+        with IncidentManager._pending_lock:
+            rows = IncidentManager._pending_frames.pop(incident.id, [])
+            state = IncidentManager._frame_state.get(incident.id)
+            if state is not None:
+                state['flushing'] += len(rows)
+        if not rows:
+            return rows
+        
+        try:
+            db.session.execute(db.insert(IncidentFrame), rows)
+        except Exception:
+            db.session.rollback()
+            IncidentManager._restore_pending_frames(incident.id, rows)
+            raise
+        incident.total_frames += len(rows)
+        incident.max_hand_count = max([incident.max_hand_count or 0] + [row['hand_count'] for row in rows])
+        incident.max_confidence = max([incident.max_confidence or 0.0] + [row['hand_confidence'] for row in rows])
+        with_images = sum(1 for row in rows if row['image_sha256'])
+        print(f"   💾 Wrote {len(rows)} frames for Incident #{incident.id} ({with_images} with images)")
+        return rows
+    
+    @staticmethod
+    def _commit_frames(flushed):
+        """Commit, then count flushed rows ({incident_id: rows}) as written; on failure roll back and re-buffer them"""
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for incident_id, rows in flushed.items():
+                IncidentManager._restore_pending_frames(incident_id, rows)
+            raise
+        
+        with IncidentManager._pending_lock:
+            for incident_id, rows in flushed.items():
+                state = IncidentManager._frame_state.get(incident_id)
+                if state is not None:
+                    state['written'] += len(rows)
+                    state['flushing'] -= len(rows)
+    
+    @staticmethod
+    def _restore_pending_frames(incident_id, rows):
+        """Put rows that failed to write back at the front of an incident's buffer"""
+        if not rows:
+            return
+        with IncidentManager._pending_lock:
+            state = IncidentManager._frame_state.get(incident_id)
+            if state is not None:
+                state['flushing'] -= len(rows)
+            IncidentManager._pending_frames[incident_id] = rows + IncidentManager._pending_frames.get(incident_id, [])
     
     @staticmethod
     def get_incident_frames_for_analysis(incident_id, last_n_frames=10):
-        """Get the last N frames of an incident for Gemini analysis"""
-        frames = IncidentFrame.query.filter_by(
+        """Get the last N frames of an incident for Gemini analysis (frame numbers and image hashes only)"""
+        frames = IncidentFrame.query.options(
+            load_only(IncidentFrame.frame_number, IncidentFrame.image_sha256)
+        ).filter_by(
             incident_id=incident_id
         ).order_by(IncidentFrame.frame_number.desc()).limit(last_n_frames).all()
         
@@ -245,21 +393,28 @@ class GeminiAnalysisManager:
         )
         db.session.add(analysis)
         
-        # Update incident with analysis results
-        incident = Incident.query.get(incident_id)
-        if incident:
-            incident.gemini_analyzed = True
-            
+        # Update incident with analysis results (in SQL, without loading the incident or session)
+        if threat_detected:
             # Only update threat status if a threat is detected
             # Once a threat is detected, keep it marked as threat
-            if threat_detected:
-                incident.threat_detected = True
-                incident.threat_confidence = confidence
-                incident.threat_explanation = explanation
+            incident_values = {
+                'gemini_analyzed': True,
+                'threat_detected': True,
+                'threat_confidence': confidence,
+                'threat_explanation': explanation
+            }
+        else:
             # If no previous threat was detected, update confidence/explanation anyway
-            elif not incident.threat_detected:
-                incident.threat_confidence = confidence
-                incident.threat_explanation = explanation
+            incident_values = {
+                'gemini_analyzed': True,
+                'threat_confidence': db.case((Incident.threat_detected == True, Incident.threat_confidence), else_=confidence),
+                'threat_explanation': db.case((Incident.threat_detected == True, Incident.threat_explanation), else_=explanation)
+            }
+        db.session.execute(db.update(Incident).where(Incident.id == incident_id).values(incident_values))
+        
+        if threat_detected:
+            incident_session_id = db.select(Incident.session_id).where(Incident.id == incident_id).scalar_subquery()
+            db.session.execute(db.update(Session).where(Session.id == incident_session_id).values(has_threat=True))
         
         db.session.commit()
         
@@ -287,7 +442,7 @@ class AlertManager:
         db.session.add(alert)
         
         # Mark incident as alerted
-        incident = Incident.query.get(incident_id)
+        incident = db.session.get(Incident, incident_id)
         if incident:
             incident.user_alerted = True
             incident.alert_sent_at = datetime.utcnow()
@@ -301,7 +456,7 @@ class AlertManager:
     @staticmethod
     def acknowledge_alert(alert_id):
         """Mark an alert as acknowledged by the user"""
-        alert = UserAlert.query.get(alert_id)
+        alert = db.session.get(UserAlert, alert_id)
         if alert:
             alert.acknowledged = True
             alert.acknowledged_at = datetime.utcnow()
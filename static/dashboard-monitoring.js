@@ -824,7 +824,7 @@ async function viewIncident(incidentId) {
           ${incident.analyses.map((analysis, idx) => {
             // Get frames for this analysis
             const analysisFrames = incident.frames.filter(f => 
-              f.frame_number >= analysis.frame_start && f.frame_number <= analysis.frame_end && f.frame_image
+              f.frame_number >= analysis.frame_start && f.frame_number <= analysis.frame_end && f.frame_url
             );
             
             return `
@@ -849,8 +849,8 @@ async function viewIncident(incidentId) {
                   </div>
                   <div style="display: grid; grid-template-columns: repeat(auto-fill, minmax(120px, 1fr)); gap: 0.5rem;">
                     ${analysisFrames.slice(0, 10).map(frame => `
-                      <div style="background: var(--background); border: 1px solid ${analysis.threat_detected ? 'var(--danger)' : 'var(--border)'}; border-radius: var(--radius); overflow: hidden; cursor: pointer;" onclick="viewFrameImage('${frame.frame_image}', ${frame.frame_number})">
-                        <img src="data:image/jpeg;base64,${frame.frame_image}" style="width: 100%; height: auto; display: block;" alt="Frame ${frame.frame_number}">
+                      <div style="background: var(--background); border: 1px solid ${analysis.threat_detected ? 'var(--danger)' : 'var(--border)'}; border-radius: var(--radius); overflow: hidden; cursor: pointer;" onclick="viewFrameImage('${frame.frame_url}', ${frame.frame_number})">
+                        <img src="${frame.frame_url}" loading="lazy" style="width: 100%; height: auto; display: block;" alt="Frame ${frame.frame_number}">
                         <div style="padding: 0.25rem; text-align: center; font-size: 0.75rem; background: var(--muted);">
                           Frame #${frame.frame_number}
                         </div>
@@ -982,7 +982,7 @@ function closeIncidentModal() {
   document.getElementById('incidentModal').style.display = 'none';
 }
 
-function viewFrameImage(base64Image, frameNumber) {
+function viewFrameImage(imageUrl, frameNumber) {
   const modal = document.createElement('div');
   modal.style.cssText = 'position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.9); z-index: 2000; display: flex; align-items: center; justify-content: center; cursor: pointer;';
   modal.onclick = () => modal.remove();
@@ -992,7 +992,7 @@ function viewFrameImage(base64Image, frameNumber) {
   container.onclick = (e) => e.stopPropagation();
   
   const img = document.createElement('img');
-  img.src = `data:image/jpeg;base64,${base64Image}`;
+  img.src = imageUrl;
   img.style.cssText = 'max-width: 100%; max-height: 80vh; border-radius: var(--radius); box-shadow: 0 20px 60px rgba(0,0,0,0.8);';
   
   const caption = document.createElement('div');
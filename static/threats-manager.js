@@ -214,12 +214,12 @@ function renderThreats() {
             </div>
           </div>
           
-          ${threat.sample_frame ? `
+          ${threat.sample_frame_url ? `
             <div style="flex-shrink: 0;">
               <div style="font-size: 0.75rem; color: var(--muted-foreground); text-transform: uppercase; margin-bottom: 0.5rem;">Sample Frame</div>
-              <img src="data:image/jpeg;base64,${threat.sample_frame}" 
+              <img src="${threat.sample_frame_url}" 
                    style="width: 200px; height: auto; border-radius: var(--radius); border: 2px solid var(--danger); cursor: pointer;"
-                   onclick="viewFrameImage('${threat.sample_frame}', ${threat.id})"
+                   onclick="viewFrameImage('${threat.sample_frame_url}', ${threat.id})"
                    alt="Threat sample">
             </div>
           ` : ''}
@@ -299,7 +299,7 @@ async function viewIncident(incidentId) {
         `<div style="display: grid; gap: 1rem; margin-bottom: 1.5rem;">
           ${incident.analyses.map((analysis, idx) => {
             const analysisFrames = incident.frames.filter(f => 
-              f.frame_number >= analysis.frame_start && f.frame_number <= analysis.frame_end && f.frame_image
+              f.frame_number >= analysis.frame_start && f.frame_number <= analysis.frame_end && f.frame_url
             );
             
             return `
@@ -324,8 +324,8 @@ async function viewIncident(incidentId) {
                   </div>
                   <div style="display: grid; grid-template-columns: repeat(auto-fill, minmax(120px, 1fr)); gap: 0.5rem;">
                     ${analysisFrames.slice(0, 10).map(frame => `
-                      <div style="background: var(--background); border: 2px solid var(--danger); border-radius: var(--radius); overflow: hidden; cursor: pointer;" onclick="viewFrameImage('${frame.frame_image}', ${frame.frame_number})">
-                        <img src="data:image/jpeg;base64,${frame.frame_image}" style="width: 100%; height: auto; display: block;" alt="Frame ${frame.frame_number}">
+                      <div style="background: var(--background); border: 2px solid var(--danger); border-radius: var(--radius); overflow: hidden; cursor: pointer;" onclick="viewFrameImage('${frame.frame_url}', ${frame.frame_number})">
+                        <img src="${frame.frame_url}" loading="lazy" style="width: 100%; height: auto; display: block;" alt="Frame ${frame.frame_number}">
                         <div style="padding: 0.25rem; text-align: center; font-size: 0.75rem; background: var(--danger); color: white;">
                           Frame #${frame.frame_number}
                         </div>
@@ -369,7 +369,7 @@ function closeIncidentModal() {
   document.getElementById('incidentModal').style.display = 'none';
 }
 
-function viewFrameImage(base64Image, frameNumber) {
+function viewFrameImage(imageUrl, frameNumber) {
   const modal = document.createElement('div');
   modal.style.cssText = 'position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.9); z-index: 2000; display: flex; align-items: center; justify-content: center; cursor: pointer;';
   modal.onclick = () => modal.remove();
@@ -379,7 +379,7 @@ function viewFrameImage(base64Image, frameNumber) {
   container.onclick = (e) => e.stopPropagation();
   
   const img = document.createElement('img');
-  img.src = `data:image/jpeg;base64,${base64Image}`;
+  img.src = imageUrl;
   img.style.cssText = 'max-width: 100%; max-height: 80vh; border-radius: var(--radius); box-shadow: 0 20px 60px rgba(0,0,0,0.8);';
   
   const caption = document.createElement('div');